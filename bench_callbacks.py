@@ -0,0 +1,139 @@
+"""
+Check that one button tap has one effect, however many times it is delivered.
+
+Every user taps "Get account" and then "Remove number", and each callback is
+delivered --duplicates times. All copies are processed concurrently
+(`concurrent_updates`) against a local stand-in for the Bot API with
+simulated latency. Afterwards every user must have exactly one assignment,
+one deduction and one refund, otherwise the script exits with status 1. Pass
+--without-dedup to run the same traffic through the handlers without the
+idempotency layer.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+def callback_update(update_id: int, tg_id: int, message_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(tg_id),
+            "data": data,
+            "from": {"id": tg_id, "is_bot": False, "first_name": "u"},
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": tg_id, "type": "private"},
+                "text": "",
+            },
+        },
+    }
+
+
+async def deliver(application, updates) -> None:
+    from telegram import Update
+
+    for data in updates:
+        await application.update_queue.put(Update.de_json(data, application.bot))
+    await application.update_queue.join()
+
+
+async def run(users: int, duplicates: int, latency: float, without_dedup: bool) -> bool:
+    from sqlalchemy import event, func
+    from telegram.ext import Application
+
+    import db
+    import main
+    from bench_workers import LocalRequest
+    from idempotency import counters
+    from models import User, Assignment, CreditTransaction, ReasonEnum
+
+    if without_dedup:
+        for name in ("get_account_callback", "code_callback", "rem_callback"):
+            setattr(main, name, getattr(main, name).__wrapped__)
+
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    builder = Application.builder().token("1:bench").updater(None).request(LocalRequest(latency)).concurrent_updates(True)
+    application = main.build_application(builder)
+    await application.initialize()
+    await application.start()
+
+    started = time.perf_counter()
+    update_id = 0
+    taps = []
+    for i in range(users):
+        for _ in range(duplicates):
+            update_id += 1
+            taps.append(callback_update(update_id, 1000 + i, 1, "get_account"))
+    await deliver(application, taps)
+
+    with db.get_session() as session:
+        assignments = session.query(Assignment.id, User.tg_id).join(User, User.id == Assignment.user_id).all()
+    taps = []
+    for assignment_id, tg_id in assignments:
+        for _ in range(duplicates):
+            update_id += 1
+            taps.append(callback_update(update_id, tg_id, 2, f"rem:{assignment_id}"))
+    await deliver(application, taps)
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.shutdown()
+
+    with db.get_session() as session:
+        per_user = session.query(func.count(Assignment.id)).group_by(Assignment.user_id).all()
+        deducted = session.query(func.count(CreditTransaction.id)).filter_by(reason=ReasonEnum.get_account).scalar()
+        refunded = session.query(func.count(CreditTransaction.id)).filter_by(reason=ReasonEnum.refund_remove).scalar()
+        credits = {credits for credits, in session.query(User.credits)}
+
+    taps_sent = users * duplicates * 2
+    print(f"{users} users x 2 buttons x {duplicates} deliveries = {taps_sent} callbacks in {elapsed:.2f}s")
+    print(f"  assignments per user:  {sorted({count for count, in per_user})}")
+    print(f"  deductions / refunds:  {deducted} / {refunded} (expected {users} / {users})")
+    print(f"  final credits:         {sorted(credits)} (expected [5])")
+    print(f"  SQL statements:        {len(statements)}")
+    print(f"  Bot API calls:         {LocalRequest.sent}")
+    print(f"  idempotency counters:  {counters}")
+    ok = set(count for count, in per_user) == {1} and deducted == refunded == users and credits == {5}
+    print("One tap, one effect: " + ("OK" if ok else "FAILED"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=5)
+    parser.add_argument("--api-latency-ms", type=float, default=20.0, help="Simulated Bot API round trip")
+    parser.add_argument("--without-dedup", action="store_true")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["SQL_ECHO"] = "false"
+
+    import logging
+    import db
+    from models import Base, User, Number, StatusEnum
+
+    logging.disable(logging.WARNING)
+    db.setup_db(Base.metadata)
+    with db.get_session() as session:
+        session.add_all(User(tg_id=1000 + i, username=f"u{i}", credits=5) for i in range(args.users))
+        session.add_all(
+            Number(phone=f"+1555{i:07d}", gs_token=f"tok{i}", status=StatusEnum.free)
+            for i in range(args.users * args.duplicates)
+        )
+        session.commit()
+
+    if not asyncio.run(run(args.users, args.duplicates, args.api_latency_ms / 1000, args.without_dedup)):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
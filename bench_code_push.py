@@ -0,0 +1,94 @@
+"""
+Benchmark latency from a pushed code arriving at POST /sms to the user being notified.
+
+Runs the real HTTP receiver and delivery path against a throwaway SQLite
+database, with a stand-in bot that records when the notification is sent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+
+class RecordingBot:
+    def __init__(self):
+        self.notified_at = {}
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.notified_at[text.rsplit(" ", 1)[-1]] = time.perf_counter()
+
+    async def send_message(self, chat_id, text):
+        self.notified_at[text.rsplit(" ", 1)[-1]] = time.perf_counter()
+
+
+def seed(session, count):
+    from models import User, Number, Assignment, StatusEnum
+
+    user = User(tg_id=1, username="bench")
+    session.add(user)
+    session.flush()
+    for i in range(count):
+        number = Number(phone=f"+1555{i:07d}", gs_token=f"tok{i}", status=StatusEnum.assigned)
+        session.add(number)
+        session.flush()
+        session.add(Assignment(user_id=user.id, number_id=number.id, active=True))
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import db
+    from models import Base
+    import code_push
+    from main import HealthCheckHandler
+
+    db.setup_db(Base.metadata)
+    db.engine.echo = False
+    with db.get_session() as session:
+        seed(session, args.requests)
+        code_push.build_index(session)
+
+    # Deliver the first half as message edits, the rest as new messages.
+    for i, entry in enumerate(code_push._active_by_token.values()):
+        entry["message_id"] = i + 1 if i % 2 == 0 else None
+
+    bot = RecordingBot()
+    loop = asyncio.new_event_loop()
+    code_push._loop = loop
+    code_push._bot = bot
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), HealthCheckHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/sms"
+
+    latencies = []
+    for i in range(args.requests):
+        body = json.dumps({"gs_token": f"tok{i}", "code": f"c{i}"}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        sent_at = time.perf_counter()
+        urllib.request.urlopen(request).read()
+        latencies.append((bot.notified_at[f"c{i}"] - sent_at) * 1000)
+
+    httpd.shutdown()
+    latencies.sort()
+    print(f"Pushed {len(latencies)} codes")
+    print(f"  median: {statistics.median(latencies):.2f} ms")
+    print(f"  p95:    {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms")
+    print(f"  max:    {latencies[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
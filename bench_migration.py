@@ -0,0 +1,105 @@
+"""
+Benchmark migrate_to_postgres.py on a synthetic database.
+
+Builds a throwaway SQLite database with the requested number of ledger rows
+(plus proportional users, numbers and assignments), migrates it to --target,
+changes a slice of the source the way a running bot would and runs the
+catch-up pass. Without --target the copy goes to a second SQLite file, which
+exercises the streaming and catch-up logic but not Postgres COPY.
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, update, func, select
+
+import migrate_to_postgres
+from models import Base, User, Number, Assignment, CreditTransaction, StatusEnum, ReasonEnum
+
+CHUNK = 50000
+
+
+def _insert_chunked(conn, table, rows_fn, count: int) -> None:
+    for low in range(0, count, CHUNK):
+        conn.execute(insert(table), [rows_fn(i) for i in range(low, min(low + CHUNK, count))])
+
+
+def build_source(url: str, transactions: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    users = max(transactions // 20, 1)
+    numbers = max(transactions // 10, 1)
+    assignments = max(transactions // 5, 1)
+    now = datetime.datetime.utcnow()
+    rng = random.Random(0)
+
+    with engine.begin() as conn:
+        _insert_chunked(conn, User.__table__, lambda i: {
+            "id": i + 1, "tg_id": 10_000_000 + i, "username": f"user{i}", "is_admin": False,
+            "credits": 0, "created_at": now, "updated_at": now - datetime.timedelta(seconds=users - i),
+        }, users)
+        _insert_chunked(conn, Number.__table__, lambda i: {
+            "id": i + 1, "phone": f"+1555{i:08d}", "gs_token": f"tok{i:010d}",
+            "status": StatusEnum.assigned if i < assignments // 10 else StatusEnum.free,
+            "created_at": now, "updated_at": now - datetime.timedelta(seconds=numbers - i),
+        }, numbers)
+        # The last tenth of assignments are still open
+        _insert_chunked(conn, Assignment.__table__, lambda i: {
+            "id": i + 1, "user_id": rng.randint(1, users), "number_id": i % numbers + 1,
+            "assigned_at": now, "released_at": None if i >= assignments * 9 // 10 else now,
+            "code_fetched_at": None, "last_code": None, "active": i >= assignments * 9 // 10,
+        }, assignments)
+        _insert_chunked(conn, CreditTransaction.__table__, lambda i: {
+            "id": i + 1, "user_id": rng.randint(1, users), "delta": -1 if i % 2 else 2,
+            "reason": ReasonEnum.get_account if i % 2 else ReasonEnum.purchase,
+            "ref_assignment_id": None, "created_at": now, "meta": {"description": "bench"} if i % 7 == 0 else None,
+        }, transactions)
+
+
+def simulate_traffic(url: str, changes: int) -> None:
+    """Touch the source the way the bot does between the bulk copy and cutover."""
+    engine = create_engine(url)
+    later = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    with engine.begin() as conn:
+        max_user = conn.execute(select(func.max(User.id))).scalar()
+        max_tx = conn.execute(select(func.max(CreditTransaction.id))).scalar()
+        conn.execute(update(User).where(User.id <= changes).values(credits=User.credits + 1, updated_at=later))
+        # Only open assignments are ever released
+        still_open = select(Assignment.id).where(Assignment.active.is_(True)).order_by(Assignment.id.desc()).limit(changes)
+        conn.execute(update(Assignment).where(Assignment.id.in_(still_open)).values(active=False, released_at=later))
+        conn.execute(insert(CreditTransaction), [
+            {"id": max_tx + i + 1, "user_id": i % max_user + 1, "delta": 1, "reason": ReasonEnum.admin_grant, "created_at": later}
+            for i in range(changes)
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=2_000_000)
+    parser.add_argument("--changes", type=int, default=1000, help="Rows touched between the bulk copy and catch-up")
+    parser.add_argument("--target", help="Empty target database; defaults to a temporary SQLite file")
+    parser.add_argument("--batch-size", type=int, default=migrate_to_postgres.BATCH_SIZE)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    source = f"sqlite:///{os.path.join(tmpdir, 'source.db')}"
+    target = args.target or f"sqlite:///{os.path.join(tmpdir, 'target.db')}"
+
+    started = time.perf_counter()
+    build_source(source, args.transactions)
+    print(f"Built source with {args.transactions} ledger rows in {time.perf_counter() - started:.1f}s")
+
+    print("Bulk copy:")
+    ok = migrate_to_postgres.migrate(source, target, batch_size=args.batch_size, check=False)
+
+    simulate_traffic(source, args.changes)
+    print(f"Catch-up after {args.changes} updated users, released assignments and new transactions:")
+    ok = migrate_to_postgres.migrate(source, target, catch_up=True, batch_size=args.batch_size) and ok
+    print("Verified" if ok else "Verification FAILED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Measure the in-memory number index: memory per million numbers, build time and
+lookup latency, next to a plain dict index and a SELECT on the unique phone
+column.
+
+Numbers are generated into a throwaway SQLite database and the index is built
+by streaming them, exactly as the bot does at startup.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+
+def seed(url: str, count: int) -> None:
+    from sqlalchemy import create_engine, insert
+    from models import Base, Number, StatusEnum
+
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for low in range(0, count, 50000):
+            conn.execute(insert(Number.__table__), [
+                {"phone": f"+1555{i:08d}", "gs_token": f"tok{i:010d}",
+                 "status": StatusEnum.assigned if i % 4 == 0 else StatusEnum.free}
+                for i in range(low, min(low + 50000, count))
+            ])
+
+
+def timed(fn, keys, repeat: int = 1) -> float:
+    """Mean microseconds per call of fn(key), median over `repeat` runs."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for key in keys:
+            fn(key)
+        samples.append((time.perf_counter() - started) / len(keys) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--numbers", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DATABASE_URL"] = url
+    os.environ["SQL_ECHO"] = "false"
+
+    import db
+    import number_index
+    from models import Base, Number
+
+    started = time.perf_counter()
+    seed(url, args.numbers)
+    print(f"Seeded {args.numbers} numbers in {time.perf_counter() - started:.1f}s")
+    db.setup_db(Base.metadata)
+    per_million = 1_000_000 / args.numbers
+
+    with db.get_session() as session:
+        started = time.perf_counter()
+        number_index.load_numbers(session)
+        build_seconds = time.perf_counter() - started
+
+        # Again under tracemalloc, which slows allocation too much to time the first pass
+        tracemalloc.start()
+        number_index.load_numbers(session)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        by_phone, by_token = {}, {}
+        for number_id, phone, gs_token in session.query(Number.id, Number.phone, Number.gs_token).yield_per(10000):
+            by_phone[phone] = number_id
+            by_token[gs_token] = number_id
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(f"Index build: {build_seconds:.2f}s ({args.numbers / build_seconds:.0f} numbers/s)")
+        print("Memory per million numbers:")
+        print(f"  index arrays:     {number_index.nbytes() * per_million / 2**20:7.1f} MiB")
+        print(f"  index retained:   {retained * per_million / 2**20:7.1f} MiB (tracemalloc, peak {peak * per_million / 2**20:.1f} MiB while building)")
+        print(f"  dict of strings:  {dict_bytes * per_million / 2**20:7.1f} MiB")
+
+        rng = random.Random(0)
+        hits = [f"+1555{rng.randrange(args.numbers):08d}" for _ in range(args.lookups)]
+        misses = [f"+1666{rng.randrange(args.numbers):08d}" for _ in range(args.lookups)]
+        select_keys = hits[:2000]
+        print("Lookup latency per call:")
+        print(f"  index hit:        {timed(number_index.phone_candidates, hits, 3):7.2f} us")
+        print(f"  index miss:       {timed(number_index.phone_candidates, misses, 3):7.2f} us")
+        print(f"  dict hit:         {timed(by_phone.get, hits, 3):7.2f} us")
+        print(f"  find_existing (new number, no query):   {timed(lambda key: number_index.find_existing(session, key, key), misses[:20000]):7.2f} us")
+        print(f"  find_existing (duplicate, one query):   {timed(lambda key: number_index.find_existing(session, key, 'x'), select_keys):7.2f} us")
+        print(f"  SELECT by phone:  {timed(lambda key: session.query(Number).filter_by(phone=key).first(), select_keys):7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
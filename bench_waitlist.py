@@ -0,0 +1,97 @@
+"""
+Measure database queries under number scarcity with the waitlist.
+
+Every user spams /getaccount while the pool is empty, then numbers are freed
+and the dispatcher serves the waitlist. SQL statements are counted for both
+phases against a throwaway SQLite database, with stand-ins for the Telegram
+objects the handlers touch.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+
+class StandInMessage:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.message_id = 1
+
+    async def reply_text(self, text, reply_markup=None):
+        return self
+
+
+class StandInBot:
+    async def send_message(self, chat_id, text, reply_markup=None):
+        return StandInMessage(chat_id)
+
+
+def make_update(tg_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=tg_id), message=StandInMessage(tg_id), callback_query=None)
+
+
+async def run(users, retries, numbers):
+    from sqlalchemy import event
+
+    import db
+    from models import User, Number, StatusEnum
+    from handlers import get_account_logic
+    from waitlist import dispatch_waitlist
+
+    with db.get_session() as session:
+        session.add_all(User(tg_id=1000 + i, username=f"u{i}", credits=1) for i in range(users))
+        session.commit()
+
+    queries = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: queries.append(1))
+
+    bot = StandInBot()
+    context = SimpleNamespace(bot=bot, application=SimpleNamespace(create_task=lambda coro: coro.close()))
+
+    started = time.perf_counter()
+    for _ in range(retries):
+        for i in range(users):
+            await get_account_logic(make_update(1000 + i), context)
+    requests = users * retries
+    print(f"Scarcity: {requests} /getaccount requests from {users} users in {time.perf_counter() - started:.2f}s")
+    print(f"  queries: {len(queries)} ({len(queries) / requests:.2f} per request, "
+          f"vs 2 per request when every retry hits the database)")
+
+    queries.clear()
+    with db.get_session() as session:
+        session.add_all(
+            Number(phone=f"+1555{i:07d}", gs_token=f"tok{i}", status=StatusEnum.free) for i in range(numbers)
+        )
+        session.commit()
+    insert_queries = len(queries)
+
+    queries.clear()
+    started = time.perf_counter()
+    served = await dispatch_waitlist(bot)
+    print(f"Dispatch: served {served} users in {time.perf_counter() - started:.2f}s")
+    print(f"  queries: {len(queries)} ({len(queries) / max(served, 1):.2f} per served request, "
+          f"{insert_queries} more to insert the numbers)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--retries", type=int, default=10)
+    parser.add_argument("--numbers", type=int, default=400)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import db
+    from models import Base
+
+    db.setup_db(Base.metadata)
+    db.engine.echo = False
+    asyncio.run(run(args.users, args.retries, args.numbers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark updates/sec against worker count in multi-worker mode.
+
+Synthetic /balance updates from many users are routed exactly as the webhook
+front routes them. Each worker talks to a local stand-in for the Bot API
+(optionally with simulated latency) instead of Telegram, and to a shared
+throwaway SQLite database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+import workers
+
+
+class LocalRequest(BaseRequest):
+    """Answers Bot API calls locally so workers can run without Telegram."""
+
+    sent = 0
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if url.endswith("/getMe"):
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            LocalRequest.sent += 1
+            chat_id = request_data.parameters.get("chat_id", 0) if request_data else 0
+            result = {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": ""}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def bench_builder():
+    latency = float(os.environ["BENCH_API_LATENCY_MS"]) / 1000
+    return Application.builder().token("1:bench").updater(None).request(LocalRequest(latency))
+
+
+def bench_worker(index, count, queue, ready, done):
+    workers.run_worker(index, count, queue, make_builder=bench_builder, ready=ready)
+    done.put(LocalRequest.sent)
+
+
+def balance_update(update_id: int, tg_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": tg_id, "type": "private"},
+            "from": {"id": tg_id, "is_bot": False, "first_name": "u"},
+            "text": "/balance",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 8}],
+        },
+    }
+
+
+def run(count: int, updates: int, users: int) -> float:
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    readies = [ctx.Event() for _ in range(count)]
+    done = ctx.Queue()
+    queues, processes = workers.start_workers(
+        count, target=_indexed_bench_worker, extra_args=(readies, done)
+    )
+    for ready in readies:
+        ready.wait()
+
+    started = time.perf_counter()
+    for i in range(updates):
+        workers.route_update(queues, balance_update(i, 1000 + i % users))
+    workers.stop_workers(queues, processes)
+    elapsed = time.perf_counter() - started
+
+    handled = sum(done.get() for _ in range(count))
+    assert handled == updates, f"expected {updates} replies, got {handled}"
+    return updates / elapsed
+
+
+def _indexed_bench_worker(index, count, queue, readies, done):
+    bench_worker(index, count, queue, readies[index], done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--api-latency-ms", type=float, default=5.0, help="Simulated Bot API round trip")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["BENCH_API_LATENCY_MS"] = str(args.api_latency_ms)
+    os.environ["SQL_ECHO"] = "false"
+
+    import db
+    from models import Base, User
+
+    db.setup_db(Base.metadata)
+    with db.get_session() as session:
+        session.add_all(User(tg_id=1000 + i, username=f"u{i}", credits=5) for i in range(args.users))
+        session.commit()
+
+    print(f"{args.updates} /balance updates from {args.users} users, {args.api_latency_ms} ms simulated API latency")
+    for count in args.workers:
+        print(f"  {count} worker(s): {run(count, args.updates, args.users):.0f} updates/sec")
+
+
+if __name__ == "__main__":
+    main()
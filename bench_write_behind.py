@@ -0,0 +1,107 @@
+"""
+Benchmark code-fetch persistence: one commit per tap versus the write-behind buffer.
+
+Each simulated tap loads the assignment like `code_callback` does and then
+persists the fetched code, either with its own commit or through
+`write_behind.record_code`. A background thread plays the role of the
+JobQueue flush job.
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+def seed(session, count):
+    from models import User, Number, Assignment, StatusEnum
+
+    user = User(tg_id=1, username="bench")
+    session.add(user)
+    session.flush()
+    for i in range(count):
+        number = Number(phone=f"+1555{i:07d}", gs_token=f"tok{i}", status=StatusEnum.assigned)
+        session.add(number)
+        session.flush()
+        session.add(Assignment(user_id=user.id, number_id=number.id, active=True))
+    session.commit()
+
+
+def tap_direct(get_session, Assignment, assignment_id, code):
+    with get_session() as session:
+        assignment = session.query(Assignment).filter_by(id=assignment_id).first()
+        assignment.last_code = code
+        assignment.code_fetched_at = datetime.datetime.utcnow()
+        session.add(assignment)
+        session.commit()
+
+
+def tap_buffered(get_session, Assignment, assignment_id, code):
+    import write_behind
+
+    with get_session() as session:
+        assignment = session.query(Assignment).filter_by(id=assignment_id).first()
+        write_behind.record_code(assignment.id, code, datetime.datetime.utcnow())
+
+
+def run(label, tap, taps, assignments, commits):
+    import db
+    from models import Assignment
+
+    latencies = []
+    commits.clear()
+    started = time.perf_counter()
+    for i in range(taps):
+        tap_started = time.perf_counter()
+        tap(db.get_session, Assignment, i % assignments + 1, f"c{i}")
+        latencies.append((time.perf_counter() - tap_started) * 1000)
+    elapsed = time.perf_counter() - started
+    print(f"{label}:")
+    print(f"  taps/sec:        {taps / elapsed:.0f}")
+    print(f"  commits:         {len(commits)} ({len(commits) / elapsed:.0f}/sec)")
+    print(f"  median tap:      {statistics.median(latencies):.3f} ms")
+    print(f"  p95 tap:         {sorted(latencies)[int(taps * 0.95) - 1]:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--taps", type=int, default=2000)
+    parser.add_argument("--assignments", type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    import db
+    from models import Base
+    from sqlalchemy import event
+    import write_behind
+
+    db.setup_db(Base.metadata)
+    db.engine.echo = False
+    with db.get_session() as session:
+        seed(session, args.assignments)
+
+    commits = []
+    event.listen(db.engine, "commit", lambda conn: commits.append(1))
+
+    run("Commit per tap", tap_direct, args.taps, args.assignments, commits)
+
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.wait(write_behind.FLUSH_INTERVAL_SECONDS):
+            write_behind.flush()
+
+    thread = threading.Thread(target=flusher)
+    thread.start()
+    run("Write-behind", tap_buffered, args.taps, args.assignments, commits)
+    stop.set()
+    thread.join()
+    write_behind.flush()
+
+
+if __name__ == "__main__":
+    main()
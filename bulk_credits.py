@@ -0,0 +1,128 @@
+import csv
+import datetime
+import io
+
+from sqlalchemy import bindparam, insert, update
+
+from models import User, CreditTransaction, ReasonEnum
+
+# Keeps IN (...) lists well below SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def target_key(target: str):
+    """Normalise an `@username` / tg_id target into a lookup key, or None if invalid."""
+    if target.startswith("@"):
+        return ("username", target[1:])
+    try:
+        return ("tg_id", int(target))
+    except ValueError:
+        return None
+
+
+def find_user(session, target: str):
+    """Return the User for an `@username` / tg_id target, or None."""
+    key = target_key(target)
+    if key is None:
+        return None
+    field, value = key
+    return session.query(User).filter_by(**{field: value}).first()
+
+
+def parse_csv(data: str):
+    """Parse `<@user_or_id>, <amount>` rows. Returns (entries, errors)."""
+    entries = []
+    errors = []
+    for line_no, row in enumerate(csv.reader(io.StringIO(data)), start=1):
+        if not row or not row[0].strip():
+            continue
+        if len(row) < 2:
+            errors.append(f"line {line_no}: expected <@user_or_id>, <amount>")
+            continue
+        target, amount = row[0].strip(), row[1].strip()
+        try:
+            delta = int(amount)
+        except ValueError:
+            if line_no == 1:
+                continue  # Header row
+            errors.append(f"line {line_no}: amount must be a number")
+            continue
+        entries.append((target, delta))
+    return entries, errors
+
+
+def resolve_targets(session, targets):
+    """Map target keys to `users.id` using one IN query per chunk."""
+    tg_ids = set()
+    usernames = set()
+    for target in targets:
+        key = target_key(target)
+        if key is None:
+            continue
+        if key[0] == "username":
+            usernames.add(key[1])
+        else:
+            tg_ids.add(key[1])
+
+    resolved = {}
+    for chunk in _chunks(sorted(tg_ids)):
+        for user_id, tg_id in session.query(User.id, User.tg_id).filter(User.tg_id.in_(chunk)):
+            resolved[("tg_id", tg_id)] = user_id
+    for chunk in _chunks(sorted(usernames)):
+        for user_id, username in session.query(User.id, User.username).filter(User.username.in_(chunk)):
+            resolved[("username", username)] = user_id
+    return resolved
+
+
+def apply_bulk_credits(session, entries, admin_id: int) -> dict:
+    """
+    Apply `(target, delta)` entries in a single transaction.
+
+    Deltas for the same user are summed, balances are updated with one
+    executemany UPDATE and one CreditTransaction row is bulk-inserted per user.
+    """
+    resolved = resolve_targets(session, [target for target, _ in entries])
+
+    deltas = {}
+    not_found = []
+    for target, delta in entries:
+        user_id = resolved.get(target_key(target))
+        if user_id is None:
+            not_found.append(target)
+            continue
+        deltas[user_id] = deltas.get(user_id, 0) + delta
+
+    if deltas:
+        now = datetime.datetime.utcnow()
+        users = User.__table__
+        session.execute(
+            update(users)
+            .where(users.c.id == bindparam("b_id"))
+            .values(credits=users.c.credits + bindparam("b_delta"), updated_at=now),
+            [{"b_id": user_id, "b_delta": delta} for user_id, delta in deltas.items()],
+        )
+        session.execute(
+            insert(CreditTransaction.__table__),
+            [
+                {
+                    "user_id": user_id,
+                    "delta": delta,
+                    "reason": ReasonEnum.admin_grant,
+                    "created_at": now,
+                    "meta": {"admin_id": admin_id, "description": f"Admin bulk added {delta} credits"},
+                }
+                for user_id, delta in deltas.items()
+            ],
+        )
+    session.commit()
+
+    return {
+        "users": len(deltas),
+        "total": sum(deltas.values()),
+        "not_found": not_found,
+    }
@@ -0,0 +1,141 @@
+import asyncio
+import datetime
+import hmac
+import ipaddress
+import logging
+import os
+
+from telegram.error import BadRequest
+
+from db import get_session, new_session, mark_write
+from models import User, Assignment, Number
+from write_behind import record_code
+
+logger = logging.getLogger(__name__)
+
+PUSH_TIMEOUT_SECONDS = 10
+
+# gs_token -> {"assignment_id", "chat_id", "message_id", "phone"} for active assignments
+_active_by_token = {}
+
+_loop = None
+_bot = None
+
+
+def index_assignment(gs_token: str, assignment_id: int, chat_id: int, phone: str, message_id: int = None) -> None:
+    _active_by_token[gs_token] = {
+        "assignment_id": assignment_id,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "phone": phone,
+    }
+
+
+def unindex_assignment(gs_token: str) -> None:
+    _active_by_token.pop(gs_token, None)
+
+
+def build_index(session) -> int:
+    """Load all active assignments into the gs_token index."""
+    _active_by_token.clear()
+    rows = (
+        session.query(Number.gs_token, Assignment.id, User.tg_id, Number.phone)
+        .join(Assignment, Assignment.number_id == Number.id)
+        .join(User, User.id == Assignment.user_id)
+        .filter(Assignment.active.is_(True))
+    )
+    for gs_token, assignment_id, tg_id, phone in rows:
+        index_assignment(gs_token, assignment_id, tg_id, phone)
+    return len(_active_by_token)
+
+
+async def attach(application) -> None:
+    """post_init hook: remember the bot and its loop and build the index."""
+    global _loop, _bot
+    _loop = asyncio.get_running_loop()
+    _bot = application.bot
+    with get_session() as session:
+        count = build_index(session)
+    logger.info(f"Indexed {count} active assignments for code push")
+
+
+def push_allowed(headers, client_host: str) -> bool:
+    """
+    Whether a POST /sms may be accepted: it must carry SMS_WEBHOOK_SECRET in
+    X-Webhook-Secret, or, when no secret is configured, come from this host.
+    """
+    secret = os.getenv("SMS_WEBHOOK_SECRET")
+    if secret:
+        return hmac.compare_digest(headers.get("X-Webhook-Secret", ""), secret)
+    try:
+        return ipaddress.ip_address(client_host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_push(payload):
+    """(gs_token, code) from a pushed JSON body. Raises ValueError if either is missing or blank."""
+    if not isinstance(payload, dict) or "gs_token" not in payload or "code" not in payload:
+        raise ValueError("expected {gs_token, code}")
+    gs_token, code = str(payload["gs_token"]).strip(), str(payload["code"]).strip()
+    # A stored code alone stops "Remove number" from refunding, so blanks are rejected
+    if not gs_token or not code:
+        raise ValueError("gs_token and code must not be empty")
+    return gs_token, code
+
+
+def active_owner(session, gs_token: str):
+    """(assignment_id, tg_id, phone) of the active assignment for `gs_token`, or None."""
+    return (
+        session.query(Assignment.id, User.tg_id, Number.phone)
+        .join(Number, Number.id == Assignment.number_id)
+        .join(User, User.id == Assignment.user_id)
+        .filter(Number.gs_token == gs_token, Assignment.active.is_(True))
+        .first()
+    )
+
+
+async def deliver_code(bot, gs_token: str, code: str) -> bool:
+    """Persist a pushed code and notify the assignment's owner. Returns False if no active assignment."""
+    entry = _active_by_token.get(gs_token)
+    # Runs as a task beside handlers, so not on the session they share
+    with new_session() as session:
+        owner_tg_id = None
+        if entry:
+            owner_tg_id = (
+                session.query(User.tg_id)
+                .join(Assignment, Assignment.user_id == User.id)
+                .filter(Assignment.id == entry["assignment_id"], Assignment.active.is_(True))
+                .scalar()
+            )
+        if owner_tg_id is None:
+            # Assigned by another worker process since this index was built, or
+            # released and possibly assigned again
+            unindex_assignment(gs_token)
+            row = active_owner(session, gs_token)
+            if not row:
+                return False
+            index_assignment(gs_token, *row)
+            entry = _active_by_token[gs_token]
+            owner_tg_id = row[1]
+
+    record_code(entry["assignment_id"], code, datetime.datetime.utcnow())
+    mark_write(owner_tg_id)
+
+    text = f"Number: {entry['phone']}\ncode: {code}"
+    if entry["message_id"]:
+        try:
+            await bot.edit_message_text(text, chat_id=entry["chat_id"], message_id=entry["message_id"])
+            return True
+        except BadRequest as e:
+            logger.warning(f"Could not edit message for assignment {entry['assignment_id']}: {e}")
+    await bot.send_message(chat_id=entry["chat_id"], text=text)
+    return True
+
+
+def push_code(gs_token: str, code: str) -> bool:
+    """Thread-safe entry point for the HTTP receiver."""
+    if _loop is None or _bot is None:
+        raise RuntimeError("Bot is not running yet")
+    future = asyncio.run_coroutine_threadsafe(deliver_code(_bot, gs_token, code), _loop)
+    return future.result(timeout=PUSH_TIMEOUT_SECONDS)
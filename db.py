@@ -1,16 +1,64 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
 import os
+import time
 
 engine = None
 SessionLocal = None
+read_engine = None
+ReadSessionLocal = None
+
+# Seconds after a write during which a user's reads stay on the primary (0 disables)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 0))
+_last_write_at = {}
 
 def setup_db(base_metadata):
-    global engine, SessionLocal
+    global engine, SessionLocal, read_engine, ReadSessionLocal
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bot.db")
-    engine = create_engine(DATABASE_URL, echo=True)
+    SQL_ECHO = os.getenv("SQL_ECHO", "true").lower() == "true"
+    engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
     base_metadata.create_all(bind=engine) # Create tables here
     SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
+    # Read-only handlers go to the replica when one is configured
+    READ_REPLICA_URL = os.getenv("READ_REPLICA_URL")
+    if READ_REPLICA_URL:
+        read_engine = create_engine(READ_REPLICA_URL, echo=SQL_ECHO)
+        ReadSessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=read_engine))
+    else:
+        read_engine = engine
+        ReadSessionLocal = SessionLocal
+
 def get_session():
-    return SessionLocal()
\ No newline at end of file
+    return SessionLocal()
+
+def new_session():
+    """
+    A session of its own rather than the thread-scoped one handlers share, for
+    work that commits or closes while a handler may be suspended mid-await.
+    """
+    return SessionLocal.session_factory()
+
+def in_new_session(fn, *args):
+    """Call `fn(session, *args)` on a new_session and close it; for jobs run with asyncio.to_thread."""
+    with new_session() as session:
+        return fn(session, *args)
+
+def get_read_session(user_tg_id: int = None):
+    """Session for read-only handlers; stays on the primary right after the user wrote."""
+    if user_tg_id is not None and recently_wrote(user_tg_id):
+        return SessionLocal()
+    return ReadSessionLocal()
+
+def mark_write(user_tg_id: int):
+    if READ_YOUR_WRITES_SECONDS > 0:
+        _last_write_at[user_tg_id] = time.monotonic()
+
+def recently_wrote(user_tg_id: int) -> bool:
+    written_at = _last_write_at.get(user_tg_id)
+    if written_at is None:
+        return False
+    if time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS:
+        return True
+    del _last_write_at[user_tg_id]
+    return False
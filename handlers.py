@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import httpx
 import random
@@ -6,9 +7,19 @@ import time
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from sqlalchemy.exc import IntegrityError
 
-from db import get_session
+from db import get_session, get_read_session, in_new_session, mark_write
 from models import User, Assignment, Number, StatusEnum, CreditTransaction, ReasonEnum
+from bulk_credits import parse_csv, apply_bulk_credits, find_user
+from rollups import read_rollups
+from code_push import index_assignment, unindex_assignment
+from write_behind import record_code, code_state
+from ledger import recompute_balance
+from history import ledger_page, format_entry, export_ledger
+from waitlist import is_waiting, has_waiters, enqueue, cancel, claim_numbers, request_dispatch, WAITLIST_HOLD_CREDIT
+from idempotency import idempotent_callback, counters as callback_counters
+import number_index
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +29,7 @@ RATE_LIMIT_SECONDS = 10  # 10 seconds cooldown for fetching codes
 
 
 async def is_admin(user_tg_id: int) -> bool:
-    with get_session() as session:
+    with get_read_session() as session:
         user = session.query(User).filter_by(tg_id=user_tg_id).first()
         return user and user.is_admin
 
@@ -35,6 +46,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             session.add(user)
             session.commit()
             session.refresh(user)
+            mark_write(user_tg_id)
 
         keyboard = [[InlineKeyboardButton("Get account", callback_data="get_account")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -49,7 +61,7 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Show current credits."""
     user_tg_id = update.effective_user.id
 
-    with get_session() as session:
+    with get_read_session(user_tg_id) as session:
         user = session.query(User).filter_by(tg_id=user_tg_id).first()
         if user:
             await update.message.reply_text(f"Your current balance is {user.credits} credits.")
@@ -62,29 +74,49 @@ async def getaccount_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await get_account_logic(update, context)
 
 
-async def get_account_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@idempotent_callback
+async def get_account_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Handle 'Get account' button callback."""
     query = update.callback_query
     await query.answer()
-    await get_account_logic(update, context, is_callback=True)
+    return await get_account_logic(update, context, is_callback=True)
 
 
-async def get_account_logic(update: Update, context: ContextTypes.DEFAULT_TYPE, is_callback: bool = False) -> None:
+async def get_account_logic(update: Update, context: ContextTypes.DEFAULT_TYPE, is_callback: bool = False) -> str:
+    """Assign a number or join the waitlist. Returns the text shown to the user."""
     user_tg_id = update.effective_user.id
     message_sender = update.callback_query.message if is_callback else update.message
 
     with get_session() as session:
+        # Repeat requests from waiting users are answered without touching the
+        # database (one query in multi-worker mode, where another worker may have served them)
+        if is_waiting(user_tg_id, session):
+            text = "You're already on the waitlist. We'll send you a number as soon as one is free."
+            await message_sender.reply_text(text)
+            return text
+
         user = session.query(User).filter_by(tg_id=user_tg_id).first()
 
         if not user or user.credits < 1:
             await message_sender.reply_text("Insufficient credits.")
-            return
+            return "Insufficient credits."
 
-        free_number = session.query(Number).filter_by(status=StatusEnum.free).first()
+        # Users already waiting are served first, so join the back of the queue
+        queue_ahead = has_waiters(session)
+        # Claimed with a conditional UPDATE, so two workers never get the same number
+        claimed = [] if queue_ahead else claim_numbers(session, 1)
+        free_number = claimed[0] if claimed else None
 
         if not free_number:
-            await message_sender.reply_text("No numbers available.")
-            return
+            position = enqueue(session, user, message_sender.chat_id)
+            mark_write(user_tg_id)
+            text = f"No numbers available right now. You're #{position} on the waitlist and will get a number as soon as one is free."
+            if WAITLIST_HOLD_CREDIT:
+                text += " 1 credit is held until then; use /cancelwait to leave the waitlist."
+            await message_sender.reply_text(text)
+            if queue_ahead:
+                request_dispatch(context)
+            return text
 
         # Deduct credit
         user.credits -= 1
@@ -99,10 +131,6 @@ async def get_account_logic(update: Update, context: ContextTypes.DEFAULT_TYPE,
         )
         session.add(credit_tx)
 
-        # Assign number
-        free_number.status = StatusEnum.assigned
-        session.add(free_number)
-
         assignment = Assignment(
             user_id=user.id,
             number_id=free_number.id,
@@ -112,24 +140,46 @@ async def get_account_logic(update: Update, context: ContextTypes.DEFAULT_TYPE,
         session.add(assignment)
         session.commit()
         session.refresh(assignment)
+        mark_write(user_tg_id)
+        # Read everything needed before awaiting; a concurrent handler's commit on
+        # the shared session would expire these objects.
+        assignment_id, phone, gs_token = assignment.id, free_number.phone, free_number.gs_token
+        number_index.set_status(free_number.id, StatusEnum.assigned)
 
         keyboard = [
-            [InlineKeyboardButton("Get code", callback_data=f"code:{assignment.id}")],
-            [InlineKeyboardButton("Remove number", callback_data=f"rem:{assignment.id}")]
+            [InlineKeyboardButton("Get code", callback_data=f"code:{assignment_id}")],
+            [InlineKeyboardButton("Remove number", callback_data=f"rem:{assignment_id}")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        await message_sender.reply_text(
-            f"Assigned number: {free_number.phone}\ncode:",
-            reply_markup=reply_markup
-        )
+        text = f"Assigned number: {phone}\ncode:"
+        message = await message_sender.reply_text(text, reply_markup=reply_markup)
+        index_assignment(gs_token, assignment_id, message.chat_id, phone, message.message_id)
+        return text
+
+
+async def cancelwait_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Leave the waitlist, refunding any held credit."""
+    user_tg_id = update.effective_user.id
+
+    if not is_waiting(user_tg_id):
+        await update.message.reply_text("You're not on the waitlist.")
+        return
+
+    with get_session() as session:
+        user = session.query(User).filter_by(tg_id=user_tg_id).first()
+        if user and cancel(session, user):
+            mark_write(user_tg_id)
+            await update.message.reply_text("You have left the waitlist.")
+        else:
+            await update.message.reply_text("You're not on the waitlist.")
 
 
 async def myaccounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List user's active assignments."""
     user_tg_id = update.effective_user.id
 
-    with get_session() as session:
+    with get_read_session(user_tg_id) as session:
         user = session.query(User).filter_by(tg_id=user_tg_id).first()
         if not user:
             await update.message.reply_text("You don't have any accounts yet.")
@@ -149,20 +199,109 @@ async def myaccounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         for assignment in active_assignments:
             number = session.query(Number).filter_by(id=assignment.number_id).first()
             if number:
+                last_code, code_fetched_at = code_state(assignment)
                 keyboard = [
                     [InlineKeyboardButton("Get code", callback_data=f"code:{assignment.id}")]
                 ]
-                if not assignment.code_fetched_at:
+                if not code_fetched_at:
                     keyboard.append([InlineKeyboardButton("Remove number", callback_data=f"rem:{assignment.id}")])
                 
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 await update.message.reply_text(
-                    f"Number: {number.phone}\nLast code: {assignment.last_code if assignment.last_code else 'None'}",
+                    f"Number: {number.phone}\nLast code: {last_code if last_code else 'None'}",
                     reply_markup=reply_markup
                 )
 
 
-async def code_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show recent credit history, or send it all as CSV with /history export."""
+    requester_tg_id = update.effective_user.id
+    args = list(context.args or [])
+    export = bool(args) and args[-1].lower() == "export"
+    if export:
+        args = args[:-1]
+
+    if len(args) > 1:
+        await update.message.reply_text("Usage: /history [export]")
+        return
+    if args and not await is_admin(requester_tg_id):
+        await update.message.reply_text("You are not authorized to view other users' history.")
+        return
+
+    with get_read_session(requester_tg_id) as session:
+        if args:
+            user = find_user(session, args[0])
+        else:
+            user = session.query(User).filter_by(tg_id=requester_tg_id).first()
+
+        if not user:
+            await update.message.reply_text("User not found." if args else "You don't have an account yet. Use /start to create one.")
+            return
+
+        user_id = user.id
+        label = user.username or user.tg_id
+        if not export:
+            rows, next_before_id = ledger_page(session, user_id)
+
+    if export:
+        # Runs off the event loop; rows are streamed to a temp file so memory stays flat
+        fileobj, count = await asyncio.to_thread(export_ledger, user_id)
+        with fileobj:
+            await update.message.reply_document(
+                document=fileobj,
+                filename=f"history_{label}.csv",
+                caption=f"{count} transactions for {label}.",
+            )
+        return
+
+    await update.message.reply_text(
+        _history_text(label, rows),
+        reply_markup=_history_markup(user_id, next_before_id),
+    )
+
+
+async def history_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle 'Older' button on /history."""
+    query = update.callback_query
+    await query.answer()
+    _, user_id, before_id = query.data.split(":")
+    user_id, before_id = int(user_id), int(before_id)
+
+    with get_read_session(update.effective_user.id) as session:
+        requester = session.query(User).filter_by(tg_id=update.effective_user.id).first()
+        if not requester or (requester.id != user_id and not requester.is_admin):
+            await query.edit_message_text("You are not authorized to view this history.")
+            return
+
+        user = session.query(User).filter_by(id=user_id).first()
+        if not user:
+            await query.edit_message_text("User not found.")
+            return
+
+        rows, next_before_id = ledger_page(session, user_id, before_id)
+        await query.edit_message_text(
+            _history_text(user.username or user.tg_id, rows),
+            reply_markup=_history_markup(user_id, next_before_id),
+        )
+
+
+def _history_text(label, rows) -> str:
+    if not rows:
+        return f"No credit history for {label}."
+    lines = [f"Credit history for {label}:"]
+    lines.extend(format_entry(row) for row in rows)
+    lines.append("\nUse /history export to download the full history as CSV.")
+    return "\n".join(lines)
+
+
+def _history_markup(user_id: int, next_before_id: int):
+    if next_before_id is None:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Older", callback_data=f"hist:{user_id}:{next_before_id}")]])
+
+
+@idempotent_callback
+async def code_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Handle 'Get code' button callback."""
     query = update.callback_query
     await query.answer()
@@ -174,42 +313,45 @@ async def code_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if user_tg_id in _last_code_request_time and \
        (current_time - _last_code_request_time[user_tg_id]) < RATE_LIMIT_SECONDS:
         remaining_time = int(RATE_LIMIT_SECONDS - (current_time - _last_code_request_time[user_tg_id]))
-        await query.edit_message_text(f"Please wait {remaining_time} seconds before requesting another code.")
-        return
+        text = f"Please wait {remaining_time} seconds before requesting another code."
+        await query.edit_message_text(text)
+        return text
     _last_code_request_time[user_tg_id] = current_time
 
     with get_session() as session:
         assignment = session.query(Assignment).filter_by(id=assignment_id).first()
         if not assignment:
             await query.edit_message_text("Assignment not found.")
-            return
+            return "Assignment not found."
 
         number = session.query(Number).filter_by(id=assignment.number_id).first()
         if not number:
             await query.edit_message_text("Number not found for this assignment.")
-            return
+            return "Number not found for this assignment."
+
+        # Read before awaiting; a commit on the shared session meanwhile would expire these objects
+        phone, gs_token = number.phone, number.gs_token
 
         # Fetch code
         try:
-            code = await fetch_code(number.gs_token)
+            code = await fetch_code(gs_token)
         except Exception as e:
-            logger.error(f"Error fetching code for assignment {assignment.id}: {e}")
+            logger.error(f"Error fetching code for assignment {assignment_id}: {e}")
             await query.edit_message_text("Temporary error fetching code. Try again.")
-            return
+            return "Temporary error fetching code. Try again."
 
         if code:
-            assignment.last_code = code
-            assignment.code_fetched_at = datetime.datetime.utcnow()
-            session.add(assignment)
-            session.commit()
-            await query.edit_message_text(
-                f"Number: {number.phone}\ncode: {code}"
-            )
+            record_code(assignment_id, code, datetime.datetime.utcnow())
+            mark_write(user_tg_id)
+            text = f"Number: {phone}\ncode: {code}"
         else:
-            await query.edit_message_text("No code found.")
+            text = "No code found."
+        await query.edit_message_text(text)
+        return text
 
 
-async def rem_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+@idempotent_callback
+async def rem_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Handle 'Remove number' button callback."""
     query = update.callback_query
     await query.answer()
@@ -219,11 +361,16 @@ async def rem_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         assignment = session.query(Assignment).filter_by(id=assignment_id).first()
         if not assignment:
             await query.edit_message_text("Assignment not found.")
-            return
+            return "Assignment not found."
 
-        if assignment.code_fetched_at:
+        # Include codes still waiting in the write-behind buffer
+        if code_state(assignment)[1]:
             await query.edit_message_text("Cannot remove after code has been fetched.")
-            return
+            return "Cannot remove after code has been fetched."
+
+        if not assignment.active:
+            await query.edit_message_text("Number already removed.")
+            return "Number already removed."
 
         user = session.query(User).filter_by(id=assignment.user_id).first()
         number = session.query(Number).filter_by(id=assignment.number_id).first()
@@ -252,9 +399,15 @@ async def rem_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             session.add(assignment)
 
             session.commit()
+            unindex_assignment(number.gs_token)
+            number_index.set_status(number.id, StatusEnum.free)
+            mark_write(user.tg_id)
             await query.edit_message_text("Number removed. 1 credit refunded.")
+            request_dispatch(context)
+            return "Number removed. 1 credit refunded."
         else:
             await query.edit_message_text("Error removing number.")
+            return "Error removing number."
 
 
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -319,17 +472,7 @@ async def addcredit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     with get_session() as session:
-        user = None
-        if target_user_str.startswith("@"):
-            username = target_user_str[1:]
-            user = session.query(User).filter_by(username=username).first()
-        else:
-            try:
-                user_id = int(target_user_str)
-                user = session.query(User).filter_by(tg_id=user_id).first()
-            except ValueError:
-                pass
-        
+        user = find_user(session, target_user_str)
         if not user:
             await update.message.reply_text("User not found.")
             return
@@ -345,6 +488,8 @@ async def addcredit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         session.add(credit_tx)
         session.commit()
+        mark_write(user.tg_id)
+        mark_write(update.effective_user.id)
         await update.message.reply_text(f"Successfully added {amount} credits to {user.username or user.tg_id}. New balance: {user.credits}")
 
 
@@ -366,17 +511,7 @@ async def setcredit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     with get_session() as session:
-        user = None
-        if target_user_str.startswith("@"):
-            username = target_user_str[1:]
-            user = session.query(User).filter_by(username=username).first()
-        else:
-            try:
-                user_id = int(target_user_str)
-                user = session.query(User).filter_by(tg_id=user_id).first()
-            except ValueError:
-                pass
-        
+        user = find_user(session, target_user_str)
         if not user:
             await update.message.reply_text("User not found.")
             return
@@ -393,9 +528,101 @@ async def setcredit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         session.add(credit_tx)
         session.commit()
+        mark_write(user.tg_id)
+        mark_write(update.effective_user.id)
         await update.message.reply_text(f"Successfully set credits for {user.username or user.tg_id} to {user.credits}")
 
 
+async def bulkcredit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Add credits to many users, from arguments or an uploaded CSV."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    errors = []
+    if update.message.document:
+        file = await update.message.document.get_file()
+        data = await file.download_as_bytearray()
+        try:
+            text = bytes(data).decode("utf-8-sig")
+        except UnicodeDecodeError:
+            await update.message.reply_text("The CSV must be UTF-8 encoded, with one <@user_or_id>, <amount> row per line.")
+            return
+        # Large files take seconds to parse and apply, so both run off the event loop
+        entries, errors = await asyncio.to_thread(parse_csv, text)
+    else:
+        if not context.args or len(context.args) < 2:
+            await update.message.reply_text(
+                "Usage: /bulkcredit <amount> <@user_or_id> [<@user_or_id> ...]\n"
+                "or upload a CSV of <@user_or_id>, <amount> rows with the caption /bulkcredit"
+            )
+            return
+        try:
+            amount = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("Amount must be a number.")
+            return
+        entries = [(target, amount) for target in context.args[1:]]
+
+    if not entries:
+        await update.message.reply_text("No valid rows found.")
+        return
+
+    summary = await asyncio.to_thread(in_new_session, apply_bulk_credits, entries, update.effective_user.id)
+    mark_write(update.effective_user.id)
+
+    lines = [f"Bulk credit applied: {summary['total']} credits across {summary['users']} users."]
+    if summary["not_found"]:
+        lines.append(f"Users not found ({len(summary['not_found'])}): {', '.join(summary['not_found'][:20])}")
+    if errors:
+        lines.append(f"Skipped rows ({len(errors)}): {'; '.join(errors[:20])}")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show usage totals from the pre-aggregated rollups."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    today = datetime.datetime.utcnow().date()
+    windows = [
+        ("Today", today),
+        ("Last 7 days", today - datetime.timedelta(days=6)),
+        ("All time", None),
+    ]
+
+    lines = []
+    with get_read_session() as session:
+        for label, since in windows:
+            rollup = read_rollups(session, since)
+            sold = rollup.get("numbers:assigned", (0, 0))[0]
+            released = rollup.get("numbers:released", (0, 0))[0]
+            refunded = rollup.get(f"credits:{ReasonEnum.refund_remove.value}", (0, 0))[0]
+            granted = sum(
+                rollup.get(f"credits:{reason.value}", (0, 0))[1]
+                for reason in (ReasonEnum.admin_grant, ReasonEnum.purchase)
+            )
+            lines.append(
+                f"{label}:\n"
+                f"  Accounts sold: {sold}\n"
+                f"  Refunded: {refunded}\n"
+                f"  Numbers released: {released}\n"
+                f"  Credits granted: {granted}"
+            )
+
+    inventory = number_index.counts()
+    lines.append(
+        f"Numbers (this process's index): {inventory[StatusEnum.free]} free, {inventory[StatusEnum.assigned]} assigned, "
+        f"{inventory[StatusEnum.retired]} retired"
+    )
+    lines.append(
+        f"Button taps (this process): {callback_counters['handled']} handled, "
+        f"{callback_counters['duplicates']} duplicates dropped"
+    )
+    await update.message.reply_text("\n".join(lines))
+
+
 async def userbalance_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Check a user's credit balance."""
     if not await is_admin(update.effective_user.id):
@@ -408,18 +635,9 @@ async def userbalance_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     target_user_str = context.args[0]
 
-    with get_session() as session:
-        user = None
-        if target_user_str.startswith("@"):
-            username = target_user_str[1:]
-            user = session.query(User).filter_by(username=username).first()
-        else:
-            try:
-                user_id = int(target_user_str)
-                user = session.query(User).filter_by(tg_id=user_id).first()
-            except ValueError:
-                pass
-        
+    # Admins see their own recent credit changes
+    with get_read_session(update.effective_user.id) as session:
+        user = find_user(session, target_user_str)
         if not user:
             await update.message.reply_text("User not found.")
             return
@@ -427,6 +645,34 @@ async def userbalance_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text(f"User {user.username or user.tg_id} has {user.credits} credits.")
 
 
+async def recompute_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Recompute a user's balance from their snapshot and the ledger since."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    if len(context.args) != 1:
+        await update.message.reply_text("Usage: /recompute <@user_or_id>")
+        return
+
+    target_user_str = context.args[0]
+
+    with get_session() as session:
+        user = find_user(session, target_user_str)
+        if not user:
+            await update.message.reply_text("User not found.")
+            return
+
+        ledger_balance, last_tx_id = recompute_balance(session, user.id)
+        status = "OK" if ledger_balance == user.credits else f"DRIFT of {user.credits - ledger_balance:+d}"
+        await update.message.reply_text(
+            f"User {user.username or user.tg_id}:\n"
+            f"Credits: {user.credits}\n"
+            f"Ledger balance: {ledger_balance} (through transaction {last_tx_id})\n"
+            f"Status: {status}"
+        )
+
+
 async def add_number_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Add a new number to the database."""
     if not await is_admin(update.effective_user.id):
@@ -440,9 +686,13 @@ async def add_number_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     phone_number, gs_token = context.args
 
     with get_session() as session:
-        existing_number = session.query(Number).filter_by(phone=phone_number).first()
+        # The index answers misses without a query; hits are confirmed against the row
+        existing_number = number_index.find_existing(session, phone_number, gs_token)
         if existing_number:
-            await update.message.reply_text(f"Number {phone_number} already exists.")
+            if existing_number.phone == phone_number:
+                await update.message.reply_text(f"Number {phone_number} already exists.")
+            else:
+                await update.message.reply_text(f"gs_token {gs_token} is already used by {existing_number.phone}.")
             return
 
         new_number = Number(
@@ -451,8 +701,56 @@ async def add_number_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             status=StatusEnum.free
         )
         session.add(new_number)
-        session.commit()
+        try:
+            session.flush()
+            number_id = new_number.id
+            session.commit()
+        except IntegrityError:
+            # Added by a script or another worker since the index was last refreshed
+            session.rollback()
+            await update.message.reply_text(f"Number {phone_number} or gs_token {gs_token} already exists.")
+            return
+        number_index.add(number_id, phone_number, gs_token)
         await update.message.reply_text(f"Successfully added number {phone_number}.")
+    request_dispatch(context)
+
+
+async def lookup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Find a number by phone or gs_token and show who holds it."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("You are not authorized to use this command.")
+        return
+
+    if len(context.args) != 1:
+        await update.message.reply_text("Usage: /lookup <phone_or_gs_token>")
+        return
+
+    key = context.args[0]
+
+    # phone and gs_token are unique-indexed, so this is one indexed lookup. The
+    # per-process number index could miss numbers added by another worker.
+    with get_read_session() as session:
+        row = (
+            session.query(Number, Assignment, User)
+            .outerjoin(Assignment, (Assignment.number_id == Number.id) & Assignment.active.is_(True))
+            .outerjoin(User, User.id == Assignment.user_id)
+            .filter((Number.phone == key) | (Number.gs_token == key))
+            .first()
+        )
+        if not row:
+            await update.message.reply_text(f"No number matches {key}.")
+            return
+
+        number, assignment, user = row
+        lines = [
+            f"Number #{number.id}: {number.phone}",
+            f"gs_token: {number.gs_token}",
+            f"Status: {number.status.value}",
+        ]
+        if assignment:
+            lines.append(f"Assignment #{assignment.id} since {assignment.assigned_at:%Y-%m-%d %H:%M}")
+            lines.append(f"Held by {user.username or user.tg_id} (tg {user.tg_id})")
+    await update.message.reply_text("\n".join(lines))
 
 
 async def fetch_code(gs_token: str) -> str:
@@ -0,0 +1,86 @@
+import csv
+import io
+import tempfile
+
+from db import get_read_session
+from models import Assignment, Number, CreditTransaction
+
+HISTORY_PAGE_SIZE = 10
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = ["id", "created_at", "delta", "reason", "assignment_id", "phone", "assigned_at", "released_at", "description"]
+
+
+def _ledger_query(session, user_id: int):
+    return (
+        session.query(
+            CreditTransaction.id,
+            CreditTransaction.created_at,
+            CreditTransaction.delta,
+            CreditTransaction.reason,
+            CreditTransaction.ref_assignment_id,
+            Number.phone,
+            Assignment.assigned_at,
+            Assignment.released_at,
+            CreditTransaction.meta,
+        )
+        .outerjoin(Assignment, Assignment.id == CreditTransaction.ref_assignment_id)
+        .outerjoin(Number, Number.id == Assignment.number_id)
+        .filter(CreditTransaction.user_id == user_id)
+    )
+
+
+def ledger_page(session, user_id: int, before_id: int = None, limit: int = HISTORY_PAGE_SIZE):
+    """
+    Newest-first page of a user's ledger, using the last seen id as the keyset cursor.
+
+    Returns (rows, next_before_id); next_before_id is None on the last page.
+    """
+    query = _ledger_query(session, user_id)
+    if before_id is not None:
+        query = query.filter(CreditTransaction.id < before_id)
+    rows = query.order_by(CreditTransaction.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def format_entry(row) -> str:
+    line = f"{row.created_at:%Y-%m-%d %H:%M}  {row.delta:+d}  {row.reason.value}"
+    if row.phone:
+        line += f"  {row.phone}"
+    return line
+
+
+def write_ledger_csv(session, user_id: int, fileobj) -> int:
+    """Stream a user's full ledger as CSV into a binary file object. Returns rows written."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    # yield_per keeps only one batch of rows in memory at a time
+    for row in _ledger_query(session, user_id).order_by(CreditTransaction.id).yield_per(EXPORT_BATCH_SIZE):
+        writer.writerow([
+            row.id,
+            row.created_at.isoformat(),
+            row.delta,
+            row.reason.value,
+            row.ref_assignment_id or "",
+            row.phone or "",
+            row.assigned_at.isoformat() if row.assigned_at else "",
+            row.released_at.isoformat() if row.released_at else "",
+            (row.meta or {}).get("description", ""),
+        ])
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def export_ledger(user_id: int):
+    """Write a user's ledger to a temporary file. Returns (fileobj, rows) with the file rewound."""
+    fileobj = tempfile.TemporaryFile()
+    with get_read_session() as session:
+        count = write_ledger_csv(session, user_id, fileobj)
+    fileobj.seek(0)
+    return fileobj, count
@@ -0,0 +1,86 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_DEDUP_SECONDS = 10
+CALLBACK_DEDUP_MAX_ENTRIES = 10000
+# How long a duplicate waits for the first tap to finish before giving up
+DUPLICATE_WAIT_SECONDS = 30
+DEFAULT_DUPLICATE_TEXT = "Already handled."
+FAILED_TEXT = "Something went wrong. Please try again."
+
+# (user_id, message_id, data) -> (expires_at, future with the first tap's outcome text), oldest first.
+# Updates from one user always reach the same process, so a per-process store is enough.
+_seen = OrderedDict()
+counters = {"handled": 0, "duplicates": 0, "waited": 0, "failed": 0, "evicted": 0}
+
+
+def callback_key(update):
+    query = update.callback_query
+    message_id = query.message.message_id if query.message else query.inline_message_id
+    return update.effective_user.id, message_id, query.data
+
+
+def _prune(now: float) -> None:
+    while _seen:
+        expires_at, outcome = next(iter(_seen.values()))
+        if len(_seen) > CALLBACK_DEDUP_MAX_ENTRIES:
+            counters["evicted"] += 1
+        elif expires_at > now or not outcome.done():
+            break
+        _seen.popitem(last=False)
+
+
+async def _answer_duplicate(key, query, outcome) -> str:
+    counters["duplicates"] += 1
+    logger.debug(f"Duplicate callback {key}")
+    if not outcome.done():
+        counters["waited"] += 1
+    try:
+        text = await asyncio.wait_for(asyncio.shield(outcome), DUPLICATE_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        text = None
+    # Callback answers are limited to 200 characters
+    await query.answer(text=(text or DEFAULT_DUPLICATE_TEXT)[:200])
+    return text
+
+
+def idempotent_callback(handler):
+    """
+    Run a callback handler once per (user, message, data) within CALLBACK_DEDUP_SECONDS.
+
+    The handler returns the text it showed the user. Repeat taps, including ones
+    arriving while the first is still running, are answered with that text
+    without calling the handler again. If the handler raises, the next tap runs it.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        key = callback_key(update)
+        now = time.monotonic()
+        _prune(now)
+        entry = _seen.get(key)
+        if entry is not None:
+            return await _answer_duplicate(key, update.callback_query, entry[1])
+
+        outcome = asyncio.get_running_loop().create_future()
+        _seen[key] = (now + CALLBACK_DEDUP_SECONDS, outcome)
+        counters["handled"] += 1
+        try:
+            text = await handler(update, context)
+        except Exception:
+            counters["failed"] += 1
+            _seen.pop(key, None)
+            outcome.set_result(FAILED_TEXT)
+            raise
+        outcome.set_result(text)
+        if key in _seen:
+            # The window starts when the first tap finished
+            _seen[key] = (time.monotonic() + CALLBACK_DEDUP_SECONDS, outcome)
+            _seen.move_to_end(key)
+        return text
+
+    return wrapper
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 
 import db
+import number_index
 from models import Base, Number, StatusEnum
 
 load_dotenv()
@@ -18,13 +19,18 @@ def insert_real_numbers():
     ]
 
     with db.SessionLocal() as session:
+        # One streaming pass instead of a SELECT per number; only index hits are queried
+        number_index.load_numbers(session)
         for phone, gs_token in numbers_to_insert:
-            existing_number = session.query(Number).filter_by(phone=phone).first()
+            existing_number = number_index.find_existing(session, phone, gs_token)
             if existing_number:
-                print(f"Number {phone} already exists. Skipping.")
+                print(f"Number {phone} or gs_token {gs_token} already exists. Skipping.")
             else:
                 number = Number(phone=phone, gs_token=gs_token, status=StatusEnum.free)
                 session.add(number)
+                session.flush()
+                # Catches duplicates within this list too
+                number_index.add(number.id, phone, gs_token)
                 print(f"Added number: {phone} with gs_token: {gs_token}")
         session.commit()
     print("Finished inserting real numbers.")
@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import func
+
+import db
+from models import User, CreditTransaction, BalanceSnapshot
+from rollups import COMMIT_LAG
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL_SECONDS = 6 * 60 * 60
+RECONCILE_INTERVAL_SECONDS = 60 * 60
+USER_CHUNK_SIZE = 1000
+
+
+def _user_chunks(session, chunk_size: int):
+    """Yield (low, high) user id ranges covering all users."""
+    max_id = session.query(func.max(User.id)).scalar() or 0
+    for low in range(1, max_id + 1, chunk_size):
+        yield low, low + chunk_size - 1
+
+
+def ledger_balances(session, low: int, high: int, upto_tx_id: int) -> dict:
+    """
+    Ledger balance for users with ids in [low, high], counting transactions up to `upto_tx_id`.
+
+    Starts from each user's snapshot and only sums transactions after it.
+    Returns {user_id: (balance, last_tx_id)}.
+    """
+    balances = {
+        user_id: (balance, last_tx_id)
+        for user_id, balance, last_tx_id in session.query(
+            BalanceSnapshot.user_id, BalanceSnapshot.balance, BalanceSnapshot.last_tx_id
+        ).filter(BalanceSnapshot.user_id.between(low, high))
+    }
+    new_transactions = (
+        session.query(CreditTransaction.user_id, func.sum(CreditTransaction.delta), func.max(CreditTransaction.id))
+        .outerjoin(BalanceSnapshot, BalanceSnapshot.user_id == CreditTransaction.user_id)
+        .filter(
+            CreditTransaction.user_id.between(low, high),
+            CreditTransaction.id > func.coalesce(BalanceSnapshot.last_tx_id, 0),
+            CreditTransaction.id <= upto_tx_id,
+        )
+        .group_by(CreditTransaction.user_id)
+    )
+    for user_id, delta, last_tx_id in new_transactions:
+        balance, _ = balances.get(user_id, (0, 0))
+        balances[user_id] = (balance + delta, last_tx_id)
+    return balances
+
+
+def recompute_balance(session, user_id: int):
+    """Ledger balance for one user in O(transactions since their snapshot). Returns (balance, last_tx_id)."""
+    upto = session.query(func.max(CreditTransaction.id)).scalar() or 0
+    return ledger_balances(session, user_id, user_id, upto).get(user_id, (0, 0))
+
+
+def take_snapshots(session, chunk_size: int = USER_CHUNK_SIZE) -> int:
+    """Advance every user's snapshot to the end of the settled ledger. Returns snapshots written."""
+    now = datetime.datetime.utcnow()
+    # A snapshot must never pass an id that a slower transaction could still commit below
+    upto = (
+        session.query(func.max(CreditTransaction.id))
+        .filter(CreditTransaction.created_at <= now - COMMIT_LAG)
+        .scalar()
+        or 0
+    )
+    written = 0
+    for low, high in _user_chunks(session, chunk_size):
+        balances = ledger_balances(session, low, high, upto)
+        existing = {
+            snapshot.user_id: snapshot
+            for snapshot in session.query(BalanceSnapshot).filter(BalanceSnapshot.user_id.between(low, high))
+        }
+        for user_id, (balance, last_tx_id) in balances.items():
+            snapshot = existing.get(user_id)
+            if snapshot is None:
+                session.add(BalanceSnapshot(user_id=user_id, balance=balance, last_tx_id=last_tx_id, taken_at=now))
+            elif snapshot.last_tx_id != last_tx_id:
+                snapshot.balance = balance
+                snapshot.last_tx_id = last_tx_id
+                snapshot.taken_at = now
+            else:
+                continue
+            written += 1
+        session.commit()
+    return written
+
+
+def reconcile(session, chunk_size: int = USER_CHUNK_SIZE) -> list:
+    """
+    Check `credits == snapshot + sum(delta since snapshot)` for every user.
+
+    Returns [(user_id, tg_id, credits, ledger_balance)] for users that drifted.
+    """
+    drifted = []
+    for low, high in _user_chunks(session, chunk_size):
+        upto = session.query(func.max(CreditTransaction.id)).scalar() or 0
+        balances = ledger_balances(session, low, high, upto)
+        users = session.query(User.id, User.tg_id, User.credits).filter(User.id.between(low, high)).all()
+        for user_id, tg_id, credits in users:
+            ledger_balance = balances.get(user_id, (0, 0))[0]
+            if credits != ledger_balance:
+                # Re-check alone in case a write landed between the two reads
+                session.rollback()
+                credits = session.query(User.credits).filter_by(id=user_id).scalar()
+                ledger_balance = recompute_balance(session, user_id)[0]
+                if credits != ledger_balance:
+                    drifted.append((user_id, tg_id, credits, ledger_balance))
+        session.rollback()
+    return drifted
+
+
+async def snapshot_job(context) -> None:
+    """JobQueue callback that advances balance snapshots."""
+    # Off the event loop, on a session handlers don't share
+    written = await asyncio.to_thread(db.in_new_session, take_snapshots)
+    logger.info(f"Wrote {written} balance snapshots")
+
+
+def _drift_report(session):
+    """Returns (drifted, admin tg_ids to notify)."""
+    drifted = reconcile(session)
+    if not drifted:
+        return [], []
+    return drifted, [tg_id for tg_id, in session.query(User.tg_id).filter_by(is_admin=True)]
+
+
+async def reconcile_job(context) -> None:
+    """JobQueue callback that flags users whose credits disagree with the ledger."""
+    # reconcile() rolls back between chunks, so it must not run on the shared handler session
+    drifted, admin_ids = await asyncio.to_thread(db.in_new_session, _drift_report)
+    if not drifted:
+        return
+
+    for user_id, tg_id, credits, ledger_balance in drifted:
+        logger.warning(f"Balance drift for user {user_id} (tg {tg_id}): credits={credits}, ledger={ledger_balance}")
+
+    lines = [f"Balance drift detected for {len(drifted)} users:"]
+    lines.extend(
+        f"  {tg_id}: credits {credits}, ledger {ledger_balance}"
+        for _, tg_id, credits, ledger_balance in drifted[:20]
+    )
+    for admin_id in admin_ids:
+        await context.bot.send_message(chat_id=admin_id, text="\n".join(lines))
@@ -1,15 +1,22 @@
 import os
+import json
 import logging
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import threading
 
 from dotenv import load_dotenv
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 
-from handlers import start_command, balance_command, getaccount_command, get_account_callback, myaccounts_command, code_callback, rem_callback, admin_command, addcredit_command, setcredit_command, userbalance_command, admin_add_credit_callback, admin_user_balance_callback, admin_list_users_callback, admin_inventory_callback, add_number_command
-from db import SessionLocal, engine, setup_db
+from handlers import start_command, balance_command, getaccount_command, get_account_callback, cancelwait_command, myaccounts_command, history_command, history_callback, code_callback, rem_callback, admin_command, addcredit_command, setcredit_command, bulkcredit_command, stats_command, recompute_command, userbalance_command, admin_add_credit_callback, admin_user_balance_callback, admin_list_users_callback, admin_inventory_callback, add_number_command, lookup_command
+from db import SessionLocal, engine, setup_db, get_session
 from models import Base
+from rollups import rollup_job, ROLLUP_INTERVAL_SECONDS
+from code_push import attach, push_code, push_allowed, parse_push
+from write_behind import flush_job, flush_on_shutdown, FLUSH_INTERVAL_SECONDS
+from ledger import snapshot_job, reconcile_job, SNAPSHOT_INTERVAL_SECONDS, RECONCILE_INTERVAL_SECONDS
+from waitlist import load_waitlist, waitlist_job, dispatch_job, configure_dispatch, WAITLIST_DISPATCH_INTERVAL_SECONDS
+from number_index import load_numbers, refresh_numbers_job, REFRESH_INTERVAL_SECONDS as NUMBER_REFRESH_INTERVAL_SECONDS
 
 load_dotenv()
 
@@ -29,40 +36,122 @@ class HealthCheckHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(b"Bot is running")
 
+    def do_POST(self):
+        """Receive pushed SMS codes: POST /sms {"gs_token": ..., "code": ...}"""
+        if self.path != "/sms":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if not push_allowed(self.headers, self.client_address[0]):
+            self._send_json(403, {"error": "forbidden"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            gs_token, code = parse_push(json.loads(self.rfile.read(length)))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            delivered = push_code(gs_token, code)
+        except Exception as e:
+            logger.error(f"Error delivering pushed code for gs_token {gs_token}: {e}")
+            self._send_json(503, {"error": "delivery failed"})
+            return
+
+        if delivered:
+            self._send_json(200, {"delivered": True})
+        else:
+            self._send_json(404, {"delivered": False, "error": "no active assignment"})
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
 def run_health_check_server():
     port = int(os.getenv("PORT", 8080)) # Default to 8080 if PORT not set
     server_address = ('', port)
-    httpd = HTTPServer(server_address, HealthCheckHandler)
+    httpd = ThreadingHTTPServer(server_address, HealthCheckHandler)
     print(f"Starting health check server on port {port}")
     httpd.serve_forever()
 
-def main() -> None:
-    """Start the bot."""
-    # Create the Application and pass it your bot's token.
-    application = Application.builder().token(os.getenv("BOT_TOKEN")).build()
+def build_application(builder) -> Application:
+    """Register all handlers on an ApplicationBuilder that already has its token set."""
+    application = builder.post_init(attach).post_shutdown(flush_on_shutdown).build()
 
     # on different commands - answer in Telegram
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("balance", balance_command))
     application.add_handler(CommandHandler("getaccount", getaccount_command))
     application.add_handler(CallbackQueryHandler(get_account_callback, pattern="^get_account$"))
+    application.add_handler(CommandHandler("cancelwait", cancelwait_command))
     application.add_handler(CommandHandler("myaccounts", myaccounts_command))
     application.add_handler(CallbackQueryHandler(code_callback, pattern=r"^code:\d+$"))
     application.add_handler(CallbackQueryHandler(rem_callback, pattern=r"^rem:\d+$"))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CallbackQueryHandler(history_callback, pattern=r"^hist:\d+:\d+$"))
 
     # Admin commands
     application.add_handler(CommandHandler("admin", admin_command))
     application.add_handler(CommandHandler("addcredit", addcredit_command))
     application.add_handler(CommandHandler("setcredit", setcredit_command))
+    application.add_handler(CommandHandler("bulkcredit", bulkcredit_command))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/bulkcredit"), bulkcredit_command))
     application.add_handler(CommandHandler("userbalance", userbalance_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("recompute", recompute_command))
     application.add_handler(CommandHandler("addnumber", add_number_command))
+    application.add_handler(CommandHandler("lookup", lookup_command))
     application.add_handler(CallbackQueryHandler(admin_add_credit_callback, pattern="^admin_add_credit$"))
     application.add_handler(CallbackQueryHandler(admin_user_balance_callback, pattern="^admin_user_balance$"))
     application.add_handler(CallbackQueryHandler(admin_list_users_callback, pattern="^admin_list_users$"))
     application.add_handler(CallbackQueryHandler(admin_inventory_callback, pattern="^admin_inventory$"))
 
+    return application
+
+def schedule_jobs(application, elect=None) -> None:
+    """
+    Register periodic jobs.
+
+    `elect(name, callback, interval)` wraps jobs that must only run in one
+    process; in single-process mode they run unconditionally.
+    """
+    shared = elect is not None
+    if elect is None:
+        elect = lambda name, callback, interval: callback
+
+    # Keep usage rollups current for /stats
+    application.job_queue.run_repeating(elect("rollups", rollup_job, ROLLUP_INTERVAL_SECONDS), interval=ROLLUP_INTERVAL_SECONDS, first=10)
+
+    # Batch code-fetch writes instead of committing on every tap
+    application.job_queue.run_repeating(flush_job, interval=FLUSH_INTERVAL_SECONDS)
+
+    # Every process keeps its own number index, so this is not elected
+    application.job_queue.run_repeating(refresh_numbers_job, interval=NUMBER_REFRESH_INTERVAL_SECONDS)
+
+    # Serve waitlisted users when numbers are freed outside the bot
+    application.job_queue.run_repeating(elect("waitlist", waitlist_job, WAITLIST_DISPATCH_INTERVAL_SECONDS), interval=WAITLIST_DISPATCH_INTERVAL_SECONDS)
+    # Handlers dispatch straight away too, under the same lease
+    configure_dispatch(elect("waitlist", dispatch_job, WAITLIST_DISPATCH_INTERVAL_SECONDS), shared)
+
+    # Snapshot balances and check User.credits against the ledger
+    application.job_queue.run_repeating(elect("snapshots", snapshot_job, SNAPSHOT_INTERVAL_SECONDS), interval=SNAPSHOT_INTERVAL_SECONDS, first=60)
+    application.job_queue.run_repeating(elect("reconcile", reconcile_job, RECONCILE_INTERVAL_SECONDS), interval=RECONCILE_INTERVAL_SECONDS, first=300)
+
+def main() -> None:
+    """Start the bot."""
     # Initialize database (create tables if they don't exist) and setup SessionLocal
     setup_db(Base.metadata)
+    with get_session() as session:
+        load_waitlist(session)
+        logger.info(f"Indexed {load_numbers(session)} numbers")
+
+    # Create the Application and pass it your bot's token.
+    application = build_application(Application.builder().token(os.getenv("BOT_TOKEN")))
+    schedule_jobs(application)
 
     # Run the bot until the user presses Ctrl-C
     application.run_polling(allowed_updates=Update.ALL_TYPES)
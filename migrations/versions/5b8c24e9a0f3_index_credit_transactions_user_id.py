@@ -0,0 +1,28 @@
+"""Index credit_transactions.user_id
+
+Revision ID: 5b8c24e9a0f3
+Revises: d27f5a93c1e4
+Create Date: 2026-10-19 14:22:09.631857
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8c24e9a0f3'
+down_revision: Union[str, Sequence[str], None] = 'd27f5a93c1e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_credit_transactions_user_id'), 'credit_transactions', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_credit_transactions_user_id'), table_name='credit_transactions')
@@ -0,0 +1,44 @@
+"""Add waitlist credit reasons
+
+Revision ID: e7b3d80c4f15
+Revises: a4e6f19c7d38
+Create Date: 2026-10-19 17:02:18.311540
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3d80c4f15'
+down_revision: Union[str, Sequence[str], None] = 'a4e6f19c7d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        # New enum values cannot be used in the transaction that adds them
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE reasonenum ADD VALUE IF NOT EXISTS 'waitlist_hold'")
+            op.execute("ALTER TYPE reasonenum ADD VALUE IF NOT EXISTS 'waitlist_refund'")
+
+    # Relabel existing waitlist rows; number refunds always reference an assignment
+    op.execute(
+        "UPDATE credit_transactions SET reason = 'waitlist_refund' "
+        "WHERE reason = 'refund_remove' AND ref_assignment_id IS NULL"
+    )
+    op.execute(
+        "UPDATE credit_transactions SET reason = 'waitlist_hold' "
+        "WHERE reason = 'get_account' AND CAST(meta AS TEXT) LIKE '%Held for waitlisted account%'"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Postgres cannot drop enum values, so only the rows are relabelled
+    op.execute("UPDATE credit_transactions SET reason = 'refund_remove' WHERE reason = 'waitlist_refund'")
+    op.execute("UPDATE credit_transactions SET reason = 'get_account' WHERE reason = 'waitlist_hold'")
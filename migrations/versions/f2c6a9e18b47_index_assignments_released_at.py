@@ -0,0 +1,28 @@
+"""Index assignments.released_at
+
+Revision ID: f2c6a9e18b47
+Revises: e7b3d80c4f15
+Create Date: 2026-10-19 17:05:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6a9e18b47'
+down_revision: Union[str, Sequence[str], None] = 'e7b3d80c4f15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_assignments_released_at'), 'assignments', ['released_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_assignments_released_at'), table_name='assignments')
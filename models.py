@@ -12,6 +12,8 @@ from sqlalchemy import (
     BigInteger,
     Enum,
     JSON,
+    Date,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -30,6 +32,8 @@ class ReasonEnum(enum.Enum):
     get_account = "get_account"
     refund_remove = "refund_remove"
     admin_set_adjust = "admin_set_adjust"
+    waitlist_hold = "waitlist_hold"
+    waitlist_refund = "waitlist_refund"
 
 
 class User(Base):
@@ -71,7 +75,7 @@ class Assignment(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     number_id = Column(Integer, ForeignKey("numbers.id"), nullable=False)
     assigned_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
-    released_at = Column(DateTime)
+    released_at = Column(DateTime, index=True)
     code_fetched_at = Column(DateTime)
     last_code = Column(String)
     active = Column(Boolean, default=True, nullable=False)
@@ -87,7 +91,7 @@ class CreditTransaction(Base):
     __tablename__ = "credit_transactions"
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     delta = Column(Integer, nullable=False)
     reason = Column(Enum(ReasonEnum), nullable=False)
     ref_assignment_id = Column(Integer, ForeignKey("assignments.id"))
@@ -107,4 +111,54 @@ class ArchivedAssignment(Base):
     assigned_at = Column(DateTime, nullable=False)
     released_at = Column(DateTime, nullable=False)
     code_fetched_at = Column(DateTime)
-    last_code = Column(String)
\ No newline at end of file
+    last_code = Column(String)
+
+
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"
+    __table_args__ = (UniqueConstraint("day", "metric"),)
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    metric = Column(String, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)
+    last_ts = Column(DateTime)
+
+
+class WaitlistEntry(Base):
+    __tablename__ = "waitlist_entries"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    credit_held = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    served_at = Column(DateTime)
+    active = Column(Boolean, default=True, nullable=False)
+
+    user = relationship("User")
+
+
+class JobLease(Base):
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    balance = Column(Integer, nullable=False)
+    last_tx_id = Column(Integer, nullable=False)
+    taken_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
@@ -0,0 +1,195 @@
+"""
+In-memory index of phone -> number id and gs_token -> number id, plus each number's status.
+
+Keys are kept as sorted arrays of 64-bit hashes with parallel number ids (about
+12 bytes per key instead of ~125 for a dict of strings), searched with bisect.
+A hash can collide, so a hit only names candidate ids; callers confirm against
+the row before trusting it. A miss is exact for the numbers this process has
+indexed, which is what makes duplicate checks free for new numbers; numbers
+added by another process are only seen after the next refresh, so writers
+still rely on the unique constraints. Statuses live in a bytearray indexed by
+number id.
+
+The index is per process: in multi-worker mode numbers added and statuses
+changed by another worker are not seen here until the next refresh.
+"""
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+
+from db import in_new_session
+from models import Number, StatusEnum
+
+BUILD_BATCH_SIZE = 10000
+# Picks up numbers inserted by scripts while the bot is running
+REFRESH_INTERVAL_SECONDS = 30
+
+_STATUSES = list(StatusEnum)
+_NO_STATUS = 255
+
+
+class _KeyIndex:
+    """Sorted 64-bit key hashes with parallel number ids."""
+
+    def __init__(self):
+        self.hashes = array("q")
+        self.ids = array("i")
+
+    def clear(self) -> None:
+        self.hashes = array("q")
+        self.ids = array("i")
+
+    def candidates(self, key: str) -> list:
+        h = hash(key)
+        low = bisect_left(self.hashes, h)
+        high = bisect_right(self.hashes, h, low)
+        return list(self.ids[low:high])
+
+    def add(self, key: str, number_id: int) -> None:
+        h = hash(key)
+        pos = bisect_right(self.hashes, h)
+        self.hashes.insert(pos, h)
+        self.ids.insert(pos, number_id)
+
+    def extend(self, hashes: array, ids: array) -> None:
+        """Add many (hash, id) pairs: sort only the new pairs and splice them in."""
+        if not hashes:
+            return
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        if not self.hashes:
+            self.hashes = array("q", (hashes[i] for i in order))
+            self.ids = array("i", (ids[i] for i in order))
+            return
+        # Existing keys are copied in slices between insertion points, not re-sorted
+        merged_hashes, merged_ids = array("q"), array("i")
+        start = 0
+        for i in order:
+            pos = bisect_right(self.hashes, hashes[i], start)
+            merged_hashes += self.hashes[start:pos]
+            merged_ids += self.ids[start:pos]
+            merged_hashes.append(hashes[i])
+            merged_ids.append(ids[i])
+            start = pos
+        merged_hashes += self.hashes[start:]
+        merged_ids += self.ids[start:]
+        self.hashes, self.ids = merged_hashes, merged_ids
+
+    def nbytes(self) -> int:
+        return self.hashes.itemsize * len(self.hashes) + self.ids.itemsize * len(self.ids)
+
+
+_by_phone = _KeyIndex()
+_by_token = _KeyIndex()
+_status = bytearray()
+# Highest id read from the table. add() does not move it, so a refresh still finds
+# numbers a script inserted below one added through the bot.
+_max_id = 0
+
+
+def set_status(number_id: int, status: StatusEnum) -> None:
+    if number_id >= len(_status):
+        _status.extend(bytes([_NO_STATUS]) * (number_id + 1 - len(_status)))
+    _status[number_id] = _STATUSES.index(status)
+
+
+def status_of(number_id: int):
+    if number_id < len(_status) and _status[number_id] != _NO_STATUS:
+        return _STATUSES[_status[number_id]]
+    return None
+
+
+def add(number_id: int, phone: str, gs_token: str, status: StatusEnum = StatusEnum.free) -> None:
+    _by_phone.add(phone, number_id)
+    _by_token.add(gs_token, number_id)
+    set_status(number_id, status)
+
+
+def add_many(rows) -> int:
+    """Index (number_id, phone, gs_token, status) rows, sorting only the new keys. Returns rows added."""
+    global _max_id
+    phone_hashes, token_hashes, ids = array("q"), array("q"), array("i")
+    for number_id, phone, gs_token, status in rows:
+        phone_hashes.append(hash(phone))
+        token_hashes.append(hash(gs_token))
+        ids.append(number_id)
+        set_status(number_id, status)
+    if not ids:
+        return 0
+    _by_phone.extend(phone_hashes, ids)
+    _by_token.extend(token_hashes, ids)
+    _max_id = max(_max_id, max(ids))
+    return len(ids)
+
+
+def phone_candidates(phone: str) -> list:
+    return _by_phone.candidates(phone)
+
+
+def token_candidates(gs_token: str) -> list:
+    return _by_token.candidates(gs_token)
+
+
+def find_existing(session, phone: str, gs_token: str):
+    """Return the Number that already uses `phone` or `gs_token`, or None. Only queries on an index hit."""
+    ids = set(phone_candidates(phone)) | set(token_candidates(gs_token))
+    if not ids:
+        return None
+    return (
+        session.query(Number)
+        .filter(Number.id.in_(ids), (Number.phone == phone) | (Number.gs_token == gs_token))
+        .first()
+    )
+
+
+def counts() -> dict:
+    """Number of indexed numbers per status."""
+    return {status: _status.count(code) for code, status in enumerate(_STATUSES)}
+
+
+def nbytes() -> int:
+    """Memory held by the index arrays, excluding object overhead."""
+    return _by_phone.nbytes() + _by_token.nbytes() + len(_status)
+
+
+def _rows(session, batch_size: int, after_id: int = 0):
+    return (
+        session.query(Number.id, Number.phone, Number.gs_token, Number.status)
+        .filter(Number.id > after_id)
+        .order_by(Number.id)
+        .yield_per(batch_size)
+    )
+
+
+def load_numbers(session, batch_size: int = BUILD_BATCH_SIZE) -> int:
+    """Rebuild the index by streaming the numbers table. Returns numbers indexed."""
+    global _max_id
+    _by_phone.clear()
+    _by_token.clear()
+    _status.clear()
+    _max_id = 0
+    return add_many(_rows(session, batch_size))
+
+
+def _new_rows(session, after_id: int, batch_size: int = BUILD_BATCH_SIZE) -> list:
+    return _rows(session, batch_size, after_id).all()
+
+
+def _merge_new(rows: list) -> int:
+    """Index rows read past _max_id, skipping numbers add() indexed meanwhile. Returns numbers added."""
+    global _max_id
+    added = add_many(row for row in rows if status_of(row[0]) is None)
+    if rows:
+        _max_id = max(_max_id, rows[-1][0])
+    return added
+
+
+def refresh_numbers(session, batch_size: int = BUILD_BATCH_SIZE) -> int:
+    """Index numbers inserted outside this process since the last load. Returns numbers added."""
+    return _merge_new(_new_rows(session, _max_id, batch_size))
+
+
+async def refresh_numbers_job(context) -> None:
+    """JobQueue callback that keeps the index in step with numbers added by scripts."""
+    # Query in a thread on a session handlers don't share; merge on the loop, where handlers update the index too
+    rows = await asyncio.to_thread(in_new_session, _new_rows, _max_id)
+    _merge_new(rows)
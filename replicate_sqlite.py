@@ -0,0 +1,41 @@
+"""
+Simulate a lagging read replica for local testing of read routing.
+
+Copies the primary SQLite database onto a replica file every `--delay`
+seconds, so the replica is always up to that far behind. Run it next to the
+bot with, e.g.:
+
+    DATABASE_URL=sqlite:///./bot.db
+    READ_REPLICA_URL=sqlite:///./replica.db
+    READ_YOUR_WRITES_SECONDS=5
+"""
+import argparse
+import sqlite3
+import time
+
+
+def replicate(source: str, target: str) -> None:
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="bot.db")
+    parser.add_argument("--target", default="replica.db")
+    parser.add_argument("--delay", type=float, default=2.0, help="Replication delay in seconds")
+    args = parser.parse_args()
+
+    print(f"Replicating {args.source} -> {args.target} every {args.delay}s")
+    while True:
+        replicate(args.source, args.target)
+        time.sleep(args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import datetime
+import logging
+
+from dotenv import load_dotenv
+from sqlalchemy import func
+
+import db
+from models import Base, Assignment, CreditTransaction, UsageRollup, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SECONDS = 60
+ROLLUP_BATCH_SIZE = 5000
+# Only rows at least this old are rolled up, leaving in-flight transactions time to
+# commit. Without it a concurrent writer can commit an id below the watermark after
+# the watermark has passed it, and that row would never be counted.
+COMMIT_LAG = datetime.timedelta(seconds=60)
+
+# Releases are walked in windows of the indexed released_at, so no pass scans all of history
+RELEASE_WINDOW = datetime.timedelta(days=1)
+
+LEDGER_WATERMARK = "credit_transactions"
+ASSIGNED_WATERMARK = "assignments_assigned"
+RELEASED_WATERMARK = "assignments_released"
+
+
+def _as_date(value):
+    # SQLite returns date() as text, Postgres as a date.
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def _get_watermark(session, name: str) -> RollupWatermark:
+    watermark = session.get(RollupWatermark, name)
+    if not watermark:
+        watermark = RollupWatermark(name=name, last_id=0)
+        session.add(watermark)
+    return watermark
+
+
+def _add_to_rollups(session, increments: dict) -> None:
+    """Merge `{(day, metric): (count, total)}` into the rollup table."""
+    if not increments:
+        return
+    days = {day for day, _ in increments}
+    metrics = {metric for _, metric in increments}
+    existing = {
+        (row.day, row.metric): row
+        for row in session.query(UsageRollup).filter(UsageRollup.day.in_(days), UsageRollup.metric.in_(metrics))
+    }
+    for key, (count, total) in increments.items():
+        row = existing.get(key)
+        if row:
+            row.count += count
+            row.total += total
+        else:
+            session.add(UsageRollup(day=key[0], metric=key[1], count=count, total=total))
+
+
+def _rollup_by_id(session, name: str, model, day_column, group_column, metric_prefix: str, value_column, batch_size: int) -> int:
+    """Roll up an append-only table in id-range chunks past its watermark. Returns rows processed."""
+    cutoff = datetime.datetime.utcnow() - COMMIT_LAG
+    max_id = session.query(func.max(model.id)).filter(day_column <= cutoff).scalar() or 0
+    watermark = _get_watermark(session, name)
+    processed = 0
+    while watermark.last_id < max_id:
+        upper = min(watermark.last_id + batch_size, max_id)
+        day = func.date(day_column)
+        group = [day] if group_column is None else [day, group_column]
+        rows = (
+            session.query(*group, func.count(model.id), func.coalesce(func.sum(value_column), 0))
+            .filter(model.id > watermark.last_id, model.id <= upper)
+            .group_by(*group)
+            .all()
+        )
+        increments = {}
+        for row in rows:
+            metric = metric_prefix if group_column is None else f"{metric_prefix}:{row[1].value}"
+            increments[(_as_date(row[0]), metric)] = (row[-2], row[-1])
+            processed += row[-2]
+        _add_to_rollups(session, increments)
+        watermark.last_id = upper
+        # Rollup rows and watermark move together, so a crash never double counts.
+        session.commit()
+    return processed
+
+
+def _rollup_releases(session) -> int:
+    """Roll up releases past the watermark one RELEASE_WINDOW of released_at at a time. Returns rows processed."""
+    watermark = _get_watermark(session, RELEASED_WATERMARK)
+    upper = datetime.datetime.utcnow() - COMMIT_LAG
+    since = watermark.last_ts
+    if since is None:
+        # First run or rebuild: start just before the oldest release
+        oldest = session.query(func.min(Assignment.released_at)).scalar()
+        since = oldest - datetime.timedelta(microseconds=1) if oldest else upper
+    processed = 0
+    while since < upper:
+        until = min(since + RELEASE_WINDOW, upper)
+        day = func.date(Assignment.released_at)
+        rows = (
+            session.query(day, func.count(Assignment.id))
+            .filter(Assignment.released_at > since, Assignment.released_at <= until)
+            .group_by(day)
+            .all()
+        )
+        _add_to_rollups(session, {(_as_date(row_day), "numbers:released"): (count, 0) for row_day, count in rows})
+        watermark.last_ts = until
+        session.commit()
+        processed += sum(count for _, count in rows)
+        since = until
+    watermark.last_ts = upper
+    session.commit()
+    return processed
+
+
+def update_rollups(session, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Fold everything written since the last watermarks into the rollups."""
+    processed = _rollup_by_id(
+        session, LEDGER_WATERMARK, CreditTransaction, CreditTransaction.created_at,
+        CreditTransaction.reason, "credits", CreditTransaction.delta, batch_size,
+    )
+    processed += _rollup_by_id(
+        session, ASSIGNED_WATERMARK, Assignment, Assignment.assigned_at,
+        None, "numbers:assigned", 0, batch_size,
+    )
+    processed += _rollup_releases(session)
+    return processed
+
+
+def rebuild_rollups(session, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Drop all rollups and watermarks and recompute them from history."""
+    session.query(UsageRollup).delete()
+    session.query(RollupWatermark).delete()
+    session.commit()
+    return update_rollups(session, batch_size)
+
+
+def read_rollups(session, since: datetime.date) -> dict:
+    """Sum rollups from `since` onwards into `{metric: (count, total)}`."""
+    query = session.query(UsageRollup.metric, func.sum(UsageRollup.count), func.sum(UsageRollup.total))
+    if since:
+        query = query.filter(UsageRollup.day >= since)
+    return {metric: (count, total) for metric, count, total in query.group_by(UsageRollup.metric)}
+
+
+async def rollup_job(context) -> None:
+    """JobQueue callback that keeps the rollups current."""
+    # Off the event loop, on a session handlers don't share
+    processed = await asyncio.to_thread(db.in_new_session, update_rollups)
+    if processed:
+        logger.info(f"Rolled up {processed} rows")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Maintain the usage rollup tables.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute rollups from scratch")
+    parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db.setup_db(Base.metadata)
+    with db.get_session() as session:
+        if args.rebuild:
+            processed = rebuild_rollups(session, args.batch_size)
+        else:
+            processed = update_rollups(session, args.batch_size)
+    print(f"Rolled up {processed} rows.")
@@ -0,0 +1,312 @@
+import asyncio
+import datetime
+import logging
+import os
+
+from sqlalchemy import insert, update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
+
+from db import new_session, mark_write
+from models import User, Assignment, Number, StatusEnum, CreditTransaction, ReasonEnum, WaitlistEntry
+from code_push import index_assignment
+from number_index import set_status
+
+logger = logging.getLogger(__name__)
+
+WAITLIST_BATCH_SIZE = 50
+WAITLIST_DISPATCH_INTERVAL_SECONDS = 30
+# Deduct the credit when a user joins the waitlist instead of when they are served.
+WAITLIST_HOLD_CREDIT = os.getenv("WAITLIST_HOLD_CREDIT", "false").lower() == "true"
+
+# tg_ids with an active entry, so repeat requests are answered without a query
+_waiting_tg_ids = set()
+_dispatch_lock = asyncio.Lock()
+# Set by configure_dispatch. When other processes serve the waitlist too, users
+# can be served elsewhere, so cached hits are confirmed against the database.
+_shared = False
+
+
+def is_waiting(tg_id: int, session=None) -> bool:
+    """Whether `tg_id` is on the waitlist. Only queries with a session, on a hit, in multi-worker mode."""
+    if tg_id not in _waiting_tg_ids:
+        return False
+    if _shared and session is not None:
+        active = (
+            session.query(WaitlistEntry.id)
+            .join(User, User.id == WaitlistEntry.user_id)
+            .filter(User.tg_id == tg_id, WaitlistEntry.active.is_(True))
+            .first()
+        )
+        if active is None:
+            _waiting_tg_ids.discard(tg_id)
+            return False
+    return True
+
+
+def has_waiters(session=None) -> bool:
+    """Whether anyone is on the waitlist. Confirmed like is_waiting."""
+    if _waiting_tg_ids and _shared and session is not None:
+        if session.query(WaitlistEntry.id).filter(WaitlistEntry.active.is_(True)).first() is None:
+            _waiting_tg_ids.clear()
+    return bool(_waiting_tg_ids)
+
+
+def load_waitlist(session) -> int:
+    """Rebuild the in-memory set of waiting users from the database."""
+    _waiting_tg_ids.clear()
+    rows = session.query(User.tg_id).join(WaitlistEntry, WaitlistEntry.user_id == User.id).filter(WaitlistEntry.active.is_(True))
+    _waiting_tg_ids.update(tg_id for tg_id, in rows)
+    return len(_waiting_tg_ids)
+
+
+def enqueue(session, user: User, chat_id: int) -> int:
+    """Add a user to the end of the waitlist. Returns their position."""
+    entry = WaitlistEntry(user_id=user.id, chat_id=chat_id, credit_held=WAITLIST_HOLD_CREDIT)
+    session.add(entry)
+
+    if WAITLIST_HOLD_CREDIT:
+        user.credits -= 1
+        session.add(user)
+        session.add(CreditTransaction(
+            user_id=user.id,
+            delta=-1,
+            reason=ReasonEnum.waitlist_hold,
+            meta={"description": "Held for waitlisted account"}
+        ))
+
+    session.commit()
+    _waiting_tg_ids.add(user.tg_id)
+    return session.query(WaitlistEntry).filter(WaitlistEntry.active.is_(True), WaitlistEntry.id <= entry.id).count()
+
+
+def cancel(session, user: User) -> bool:
+    """Remove a user from the waitlist, refunding any held credit."""
+    entry = session.query(WaitlistEntry).filter_by(user_id=user.id, active=True).first()
+    _waiting_tg_ids.discard(user.tg_id)
+    if not entry:
+        return False
+
+    if entry.credit_held:
+        user.credits += 1
+        session.add(user)
+        session.add(CreditTransaction(
+            user_id=user.id,
+            delta=1,
+            reason=ReasonEnum.waitlist_refund,
+            meta={"description": "Refund for leaving the waitlist"}
+        ))
+
+    entry.active = False
+    session.add(entry)
+    session.commit()
+    return True
+
+
+def claim_numbers(session, limit: int) -> list:
+    """
+    Mark up to `limit` free numbers assigned. Returns (id, phone, gs_token) rows.
+
+    The UPDATE only matches numbers that are still free, so one claimed by another
+    worker in the meantime is skipped instead of handed out twice. On Postgres the
+    candidates are also locked with SKIP LOCKED so concurrent claims pick different rows.
+    """
+    claimed = []
+    while len(claimed) < limit:
+        candidates = [
+            number_id for number_id, in session.query(Number.id)
+            .filter_by(status=StatusEnum.free)
+            .order_by(Number.id)
+            .limit(limit - len(claimed))
+            .with_for_update(skip_locked=True)
+        ]
+        if not candidates:
+            break
+        claimed += session.execute(
+            update(Number)
+            .where(Number.id.in_(candidates), Number.status == StatusEnum.free)
+            .values(status=StatusEnum.assigned)
+            .returning(Number.id, Number.phone, Number.gs_token)
+            .execution_options(synchronize_session=False)
+        ).all()
+    return claimed
+
+
+def assign_batch(session, limit: int = WAITLIST_BATCH_SIZE):
+    """
+    Serve up to `limit` of the oldest waitlist entries in one transaction.
+
+    Returns (assigned, dropped): dicts describing new assignments to announce,
+    and chat ids of users dropped for lack of credits.
+    """
+    entries = (
+        session.query(WaitlistEntry)
+        .filter_by(active=True)
+        .order_by(WaitlistEntry.id)
+        .limit(limit)
+        .all()
+    )
+    if not entries:
+        return [], []
+
+    users = {user.id: user for user in session.query(User).filter(User.id.in_({e.user_id for e in entries}))}
+    needed = sum(1 for entry in entries if entry.credit_held or users[entry.user_id].credits >= 1)
+    if needed:
+        free_numbers = claim_numbers(session, needed)
+        available = bool(free_numbers)
+    else:
+        # Only users without credits are at the front; they are dropped once a number is free
+        free_numbers = []
+        available = session.query(Number.id).filter_by(status=StatusEnum.free).first() is not None
+    if not available:
+        return [], []
+
+    numbers = iter(free_numbers)
+    now = datetime.datetime.utcnow()
+    served = []
+    dropped = []
+    credit_rows = []
+
+    for entry in entries:
+        user = users[entry.user_id]
+        if not entry.credit_held and user.credits < 1:
+            entry.active = False
+            entry.served_at = now
+            dropped.append((user.tg_id, entry.chat_id))
+            continue
+
+        number = next(numbers, None)
+        if number is None:
+            break
+
+        if not entry.credit_held:
+            user.credits -= 1
+            credit_rows.append({
+                "user_id": user.id,
+                "delta": -1,
+                "reason": ReasonEnum.get_account,
+                "created_at": now,
+                "meta": {"description": "Deducted for getting an account"},
+            })
+
+        entry.active = False
+        entry.served_at = now
+        served.append((user.tg_id, user.id, entry.chat_id, number))
+
+    assigned = []
+    assignment_ids = {}
+    if served:
+        # One multi-row INSERT each instead of a round trip per served user
+        rows = session.execute(
+            insert(Assignment).returning(Assignment.id, Assignment.number_id),
+            [
+                {"user_id": user_id, "number_id": number.id, "assigned_at": now, "active": True}
+                for _, user_id, _, number in served
+            ],
+        )
+        assignment_ids = {number_id: assignment_id for assignment_id, number_id in rows}
+        assigned = [
+            {
+                "chat_id": chat_id,
+                "assignment_id": assignment_ids[number.id],
+                "phone": number.phone,
+                "gs_token": number.gs_token,
+            }
+            for _, _, chat_id, number in served
+        ]
+    if credit_rows:
+        session.execute(insert(CreditTransaction.__table__), credit_rows)
+    session.commit()
+
+    for tg_id, _, _, _ in served:
+        _waiting_tg_ids.discard(tg_id)
+        mark_write(tg_id)
+    # Number ids were captured before the commit expired the objects
+    for number_id in assignment_ids:
+        set_status(number_id, StatusEnum.assigned)
+    for tg_id, _ in dropped:
+        _waiting_tg_ids.discard(tg_id)
+    return assigned, [chat_id for _, chat_id in dropped]
+
+
+async def dispatch_waitlist(bot) -> int:
+    """Assign freed numbers to waiting users in FIFO order and notify them. Returns users served."""
+    if not has_waiters():
+        return 0
+
+    served = 0
+    async with _dispatch_lock:
+        while True:
+            # Not the shared handler session: its commit would expire a suspended handler's objects
+            with new_session() as session:
+                assigned, dropped = assign_batch(session)
+            if not assigned and not dropped:
+                break
+
+            # The batch is already committed, so one unreachable user must not stop the rest
+            for chat_id in dropped:
+                try:
+                    await bot.send_message(chat_id=chat_id, text="A number became available, but you have insufficient credits. You have been removed from the waitlist.")
+                except TelegramError as e:
+                    logger.warning(f"Could not notify waitlisted chat {chat_id}: {e}")
+
+            for item in assigned:
+                keyboard = [
+                    [InlineKeyboardButton("Get code", callback_data=f"code:{item['assignment_id']}")],
+                    [InlineKeyboardButton("Remove number", callback_data=f"rem:{item['assignment_id']}")]
+                ]
+                message_id = None
+                try:
+                    message = await bot.send_message(
+                        chat_id=item["chat_id"],
+                        text=f"A number is now available!\nAssigned number: {item['phone']}\ncode:",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                    message_id = message.message_id
+                except TelegramError as e:
+                    logger.warning(f"Could not notify chat {item['chat_id']} of assignment {item['assignment_id']}: {e}")
+                index_assignment(item["gs_token"], item["assignment_id"], item["chat_id"], item["phone"], message_id)
+            served += len(assigned)
+
+    if served:
+        logger.info(f"Served {served} waitlisted users")
+    return served
+
+
+async def dispatch_job(context) -> None:
+    """Dispatch right away; started by handlers after a number is freed or a user queues behind others."""
+    await dispatch_waitlist(context.bot)
+
+
+_dispatch = dispatch_job
+
+
+def configure_dispatch(dispatch, shared: bool) -> None:
+    """
+    Set how request_dispatch runs. In multi-worker mode `dispatch` is dispatch_job
+    wrapped in the "waitlist" lease, so only the worker holding it serves the
+    waitlist; the others leave it to that worker's next periodic run.
+    """
+    global _dispatch, _shared
+    _dispatch = dispatch
+    _shared = shared
+
+
+def request_dispatch(context) -> None:
+    """Serve waiting users in the background, if there are any."""
+    if has_waiters():
+        context.application.create_task(_dispatch(context))
+
+
+async def waitlist_job(context) -> None:
+    """JobQueue callback that catches numbers freed outside the bot, e.g. by import scripts."""
+    # Entries may have been added or served by other worker processes
+    await refresh_waitlist_job(context)
+    await dispatch_waitlist(context.bot)
+
+
+async def refresh_waitlist_job(context) -> None:
+    """JobQueue callback that resyncs the in-memory waiting set with the database."""
+    # Stays on the loop, so no enqueue can land between the query and the swap
+    with new_session() as session:
+        load_waitlist(session)
@@ -0,0 +1,264 @@
+"""
+Multi-worker mode: one webhook front process fanning updates out to N bot workers.
+
+Updates are routed by user id, so each user's updates are handled in order by
+the same worker. Every worker runs the normal handlers with its own database
+pool; periodic jobs that must run once (rollups, waitlist dispatch) are
+elected through a lease row in `job_leases`.
+
+    python workers.py --workers 4
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from code_push import active_owner, parse_push, push_allowed
+from db import setup_db, get_session, new_session
+from models import Base, JobLease
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram"
+# A lease outlives a few missed runs before another worker takes over
+LEASE_INTERVALS = 3
+
+
+def partition_key(data: dict) -> int:
+    """The id that decides which worker handles a raw update: its sender, else its chat."""
+    for value in data.values():
+        if isinstance(value, dict):
+            for field in ("from", "user", "chat"):
+                sender = value.get(field)
+                if isinstance(sender, dict) and "id" in sender:
+                    return sender["id"]
+    return data.get("update_id", 0)
+
+
+def route_update(queues, data: dict) -> None:
+    queues[partition_key(data) % len(queues)].put(data)
+
+
+def acquire_lease(session, name: str, owner: str, ttl: datetime.timedelta) -> bool:
+    """Take or renew the lease `name`. Returns True if `owner` holds it."""
+    now = datetime.datetime.utcnow()
+    renewed = (
+        session.query(JobLease)
+        .filter(JobLease.name == name, or_(JobLease.owner == owner, JobLease.expires_at < now))
+        .update({"owner": owner, "expires_at": now + ttl}, synchronize_session=False)
+    )
+    if renewed:
+        session.commit()
+        return True
+
+    if session.get(JobLease, name) is not None:
+        session.rollback()
+        return False
+    try:
+        session.add(JobLease(name=name, owner=owner, expires_at=now + ttl))
+        session.commit()
+        return True
+    except IntegrityError:
+        # Another worker created it first
+        session.rollback()
+        return False
+
+
+def elector(owner: str):
+    """Build the `elect` wrapper for main.schedule_jobs."""
+    def elect(name, callback, interval):
+        ttl = datetime.timedelta(seconds=interval * LEASE_INTERVALS)
+
+        async def job(context):
+            # Not the shared handler session: committing it would expire a suspended handler's objects
+            with new_session() as session:
+                leader = acquire_lease(session, name, owner, ttl)
+            if leader:
+                await callback(context)
+        return job
+    return elect
+
+
+def default_builder():
+    return Application.builder().token(os.getenv("BOT_TOKEN")).updater(None)
+
+
+async def _serve(application, queue, ready):
+    from code_push import attach, deliver_code
+    from write_behind import flush_on_shutdown
+
+    loop = asyncio.get_running_loop()
+    await application.initialize()
+    # post_init/post_shutdown only run under run_polling/run_webhook
+    await attach(application)
+    await application.start()
+    if ready is not None:
+        ready.set()
+
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            if "sms_push" in data:
+                push = data["sms_push"]
+                application.create_task(deliver_code(application.bot, push["gs_token"], push["code"]))
+                continue
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await flush_on_shutdown(application)
+        await application.shutdown()
+
+
+def run_worker(index: int, workers: int, queue, make_builder=default_builder, ready=None) -> None:
+    """Worker process entry point: handle updates from `queue` until it yields None."""
+    # The supervisor shuts workers down through their queues
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    load_dotenv()
+    logging.basicConfig(
+        format=f"%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    )
+
+    from main import build_application, schedule_jobs
+    from waitlist import load_waitlist, refresh_waitlist_job, WAITLIST_DISPATCH_INTERVAL_SECONDS
+    from number_index import load_numbers
+
+    setup_db(Base.metadata)
+    with get_session() as session:
+        load_waitlist(session)
+        load_numbers(session)
+
+    application = build_application(make_builder())
+    schedule_jobs(application, elect=elector(f"{socket.gethostname()}:{os.getpid()}"))
+    # Only the elected worker dispatches, but every worker needs a current waiting set
+    application.job_queue.run_repeating(refresh_waitlist_job, interval=WAITLIST_DISPATCH_INTERVAL_SECONDS)
+
+    asyncio.run(_serve(application, queue, ready))
+
+
+class FrontHandler(BaseHTTPRequestHandler):
+    queues = []
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html')
+        self.end_headers()
+        self.wfile.write(f"Bot is running with {len(self.queues)} workers".encode())
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+
+        if self.path == WEBHOOK_PATH:
+            secret = os.getenv("WEBHOOK_SECRET")
+            if secret and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                self._reply(403)
+                return
+            if not isinstance(data, dict):
+                self._reply(400)
+                return
+            route_update(self.queues, data)
+            self._reply(200)
+        elif self.path == "/sms":
+            if not push_allowed(self.headers, self.client_address[0]):
+                self._reply(403)
+                return
+            try:
+                gs_token, code = parse_push(data)
+            except ValueError:
+                self._reply(400)
+                return
+            with get_session() as session:
+                owner = active_owner(session, gs_token)
+            if owner is None:
+                self._reply(404)
+                return
+            # Delivered by the owner's worker, whose write-behind buffer "Remove number" reads
+            _, tg_id, _ = owner
+            self.queues[tg_id % len(self.queues)].put({"sms_push": {"gs_token": gs_token, "code": code}})
+            self._reply(202)
+        else:
+            self._reply(404)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_workers(workers: int, target=run_worker, extra_args=()):
+    """Spawn worker processes. Returns (queues, processes)."""
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=target, args=(index, workers, queues[index], *extra_args), name=f"worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return queues, processes
+
+
+def stop_workers(queues, processes) -> None:
+    for queue in queues:
+        queue.put(None)
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(format="%(asctime)s - front - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    # Create tables once, before the workers race to do it
+    setup_db(Base.metadata)
+
+    queues, processes = start_workers(args.workers)
+    FrontHandler.queues = queues
+
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        bot = Bot(os.getenv("BOT_TOKEN"))
+        asyncio.run(bot.set_webhook(
+            url=webhook_url.rstrip("/") + WEBHOOK_PATH,
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            allowed_updates=Update.ALL_TYPES,
+        ))
+
+    port = int(os.getenv("PORT", 8080))
+    httpd = ThreadingHTTPServer(('', port), FrontHandler)
+    logger.info(f"Routing updates on port {port} to {args.workers} workers")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        stop_workers(queues, processes)
+
+
+if __name__ == "__main__":
+    main()
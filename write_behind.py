@@ -0,0 +1,78 @@
+import logging
+import threading
+
+from sqlalchemy import bindparam, update
+
+from db import new_session
+from models import Assignment
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 0.2
+FLUSH_MAX_ITEMS = 100
+
+# assignment_id -> {"last_code", "code_fetched_at"} not yet written to the database
+_pending = {}
+_lock = threading.Lock()
+
+
+def record_code(assignment_id: int, code: str, fetched_at) -> None:
+    """Queue a fetched code for the next batched write."""
+    with _lock:
+        _pending[assignment_id] = {"last_code": code, "code_fetched_at": fetched_at}
+        full = len(_pending) >= FLUSH_MAX_ITEMS
+    if full:
+        flush()
+
+
+def code_state(assignment):
+    """Return (last_code, code_fetched_at) for an assignment, including unflushed values."""
+    with _lock:
+        pending = _pending.get(assignment.id)
+    if pending:
+        return pending["last_code"], pending["code_fetched_at"]
+    return assignment.last_code, assignment.code_fetched_at
+
+
+def flush() -> int:
+    """Write all pending codes in one executemany UPDATE. Returns rows written."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+
+    assignments = Assignment.__table__
+    try:
+        # Not the shared handler session: committing it would expire a suspended handler's objects
+        with new_session() as session:
+            session.execute(
+                update(assignments)
+                .where(assignments.c.id == bindparam("b_id"))
+                .values(last_code=bindparam("b_code"), code_fetched_at=bindparam("b_at")),
+                [
+                    {"b_id": assignment_id, "b_code": values["last_code"], "b_at": values["code_fetched_at"]}
+                    for assignment_id, values in batch.items()
+                ],
+            )
+            session.commit()
+    except Exception as e:
+        logger.error(f"Error flushing {len(batch)} fetched codes: {e}")
+        # Put the batch back without clobbering anything recorded since.
+        with _lock:
+            for assignment_id, values in batch.items():
+                _pending.setdefault(assignment_id, values)
+        return 0
+    return len(batch)
+
+
+async def flush_job(context) -> None:
+    """JobQueue callback that flushes pending codes every FLUSH_INTERVAL_SECONDS."""
+    flush()
+
+
+async def flush_on_shutdown(application) -> None:
+    """post_shutdown hook so buffered codes are not lost on exit."""
+    flushed = flush()
+    if flushed:
+        logger.info(f"Flushed {flushed} buffered codes on shutdown")